@@ -0,0 +1,91 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.benchmark import Timer
+
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=100, help='input batch size')
+parser.add_argument('--image_size', type=int, default=32, help='the height / width of the input image to network')
+parser.add_argument('--iters', type=int, default=20, help='timed iterations per setting')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def sample_latent_numpy(trainer, noise, label):
+    # reference: labels, noise and one-hot built in numpy, then copied to the device
+    batch_size = noise.size(0)
+    c_label = np.random.randint(0, trainer.nl, batch_size)
+    noise_ = np.random.normal(0, 1, (batch_size, trainer.nz))
+    class_onehot = np.zeros((batch_size, trainer.nl))
+    class_onehot[np.arange(batch_size), c_label] = 1
+    noise_[np.arange(batch_size), :trainer.nl] = class_onehot[np.arange(batch_size)]
+    noise.copy_(torch.from_numpy(noise_).view(batch_size, trainer.nz, 1, 1))
+    label.copy_(torch.from_numpy(c_label))
+
+
+def get_trainer(config):
+    args = ['--dataset', 'fake', '--batch_size', str(config.batch_size), '--image_size', str(config.image_size)]
+    if config.cuda:
+        args.append('--cuda')
+    trainer_config = trainer_parser.parse_args(args)
+    trainer_config.manual_seed = 0
+    return Trainer(trainer_config, None)
+
+
+def bench_latent(config):
+    trainer = get_trainer(config)
+    device = trainer.device
+
+    real = torch.randn(config.batch_size, 3, config.image_size, config.image_size, device=device)
+    real_label = torch.randint(trainer.nl, (config.batch_size,), device=device)
+    noise = torch.empty(config.batch_size, trainer.nz, 1, 1, device=device)
+    label = torch.empty(config.batch_size, dtype=torch.long, device=device)
+    ones = torch.ones(config.batch_size, device=device)
+    zeros = torch.zeros(config.batch_size, device=device)
+
+    dis_criterion = nn.BCELoss()
+    aux_criterion = nn.NLLLoss()
+    optimizerD = torch.optim.Adam(trainer.netD.parameters(), lr=trainer.lr, betas=(trainer.beta1, 0.999))
+    optimizerG = torch.optim.Adam(trainer.netG.parameters(), lr=trainer.lr, betas=(trainer.beta1, 0.999))
+
+    def step(sample_latent):
+        # the trainer's D and G updates with the given latent construction
+        trainer.netD.zero_grad()
+        dis_out, aux_out = trainer.netD(real)
+        (dis_criterion(dis_out, ones) + aux_criterion(aux_out, real_label)).backward()
+
+        sample_latent(noise, label)
+        fake = trainer.netG(noise)
+        dis_out, aux_out = trainer.netD(fake.detach())
+        (dis_criterion(dis_out, zeros) + aux_criterion(aux_out, label)).backward()
+        optimizerD.step()
+
+        trainer.netG.zero_grad()
+        dis_out, aux_out = trainer.netD(fake)
+        (dis_criterion(dis_out, ones) + aux_criterion(aux_out, label)).backward()
+        optimizerG.step()
+
+    print("[*] ACGAN class-conditional latent: numpy + copy vs on-device, batch %d" % config.batch_size)
+    for name, sample_latent in (('numpy', lambda noise, label: sample_latent_numpy(trainer, noise, label)),
+                                ('device', trainer.sample_latent)):
+        latent_time = Timer('sample_latent(noise, label)', globals=locals(),
+                            num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        step_time = Timer('step(sample_latent)', globals=locals(),
+                          num_threads=torch.get_num_threads()).timeit(config.iters).mean
+
+        print('%-6s - latent: %.3f ms, step: %.2f ms, %.2f steps/s'
+              % (name, latent_time * 1e3, step_time * 1e3, 1 / step_time))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    bench_latent(config)
@@ -2,10 +2,10 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import torchvision.utils as vutils
-import numpy as np
 from torch.autograd import Variable
 
 import models.acgan as acgan
+from checkpoint import CheckpointWriter
 
 
 def weights_init(m):
@@ -28,6 +28,8 @@ class Trainer(object):
         self.ngf = int(config.ngf)
         self.ndf = int(config.ndf)
         self.cuda = config.cuda
+        self.device = torch.device('cuda' if self.cuda else 'cpu')
+        self.manual_seed = config.manual_seed
 
         self.batch_size = config.batch_size
         self.image_size = config.image_size
@@ -39,6 +41,8 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.nl = config.nl  # add nl
 
         self.build_model()
@@ -47,6 +51,10 @@ class Trainer(object):
             self.netD.cuda()
             self.netG.cuda()
 
+        # class-conditional latents are drawn on the device from their own generator
+        self.generator = torch.Generator(self.device)
+        self.generator.manual_seed(self.manual_seed)
+
     def build_model(self):
         self.netG = acgan._netG(self.ngpu, self.nz, self.ngf, self.nc)
         self.netG.apply(weights_init)
@@ -57,6 +65,12 @@ class Trainer(object):
         if self.config.netD != '':
             self.netD.load_state_dict(torch.load(self.config.netD))
 
+    def sample_latent(self, noise, label):
+        # in place on the device: random labels, randn noise, first nl dimensions replaced by the label one-hot
+        label.random_(0, self.nl, generator=self.generator)
+        noise.normal_(0, 1, generator=self.generator)
+        noise[:, :self.nl].zero_().scatter_(1, label.view(-1, 1, 1, 1), 1.0)
+
     def train(self):
         dis_criterion = nn.BCELoss()
         aux_criterion = nn.NLLLoss()  # add class loss
@@ -113,15 +127,9 @@ class Trainer(object):
                 D_x = dis_out.data.mean()
 
                 # train with fake
-                noisev.data.resize_(batch_size, self.nz, 1, 1).normal_(0, 1)
-                c_label = np.random.randint(0, self.nl, batch_size)
-                noisev_ = np.random.normal(0, 1, (batch_size, self.nz))
-                class_onehot = np.zeros((batch_size, self.nl))
-                class_onehot[np.arange(batch_size), c_label] = 1
-                noisev_[np.arange(batch_size), :self.nl] = class_onehot[np.arange(batch_size)]
-                noisev_ = (torch.from_numpy(noisev_))
-                noisev.data.copy_(noisev_.view(batch_size, self.nz, 1, 1))
-                aux_labelv.data.resize_(batch_size).copy_(torch.from_numpy(c_label))
+                noisev.data.resize_(batch_size, self.nz, 1, 1)
+                aux_labelv.data.resize_(batch_size)
+                self.sample_latent(noisev.data, aux_labelv.data)
 
                 fake = self.netG(noisev)
                 dis_labelv.data.fill_(fake_label)
@@ -167,5 +175,7 @@ class Trainer(object):
                                       normalize=True)
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch+1))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch+1))
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch+1): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch+1): self.netD.state_dict()})
+
+        self.checkpoint.close()
@@ -17,11 +17,24 @@ parser.add_argument('--beta2', type=float, default=0.999)
 parser.add_argument('--gamma', type=float, default=0.5)
 parser.add_argument('--lambda_k', type=float, default=0.001)
 parser.add_argument('--lr_update_step', type=int, default=10000)
+parser.add_argument('--fused_d', action='store_true', help='run D once on the concatenated real and fake batch')
+parser.add_argument('--reuse_fake', action='store_true', help='reuse the D step fake batch for the G step instead of sampling a new one')
+parser.add_argument('--sample_step', type=int, default=100, help='steps between sample dumps')
+parser.add_argument('--measure_window', type=int, default=1000, help='steps the convergence measure is averaged over')
+parser.add_argument('--plateau_patience', type=int, default=5, help='windows without improvement before the measure counts as plateaued')
+parser.add_argument('--plateau_tol', type=float, default=0.01, help='relative improvement of the smoothed measure that resets the patience')
+parser.add_argument('--plateau_action', default='none', choices=['none', 'decay', 'stop'], help='on a plateau: nothing | decay the learning rate | stop training')
+parser.add_argument('--lr_decay', type=float, default=0.5, help='learning rate factor applied on a plateau with --plateau_action decay')
+parser.add_argument('--min_lr', type=float, default=1e-6, help='stop training once the decayed learning rate falls below this')
+parser.add_argument('--adaptive_spacing', action='store_true', help='double the sample and checkpoint spacing on every plateau')
+parser.add_argument('--max_spacing', type=int, default=16, help='largest spacing multiplier with --adaptive_spacing')
 parser.add_argument('--cuda', action='store_true', help='enables cuda')
 parser.add_argument('--ngpu', type=int, default=1, help='number of GPUs to use')
 parser.add_argument('--netG', default='', help="path to netG (to continue training)")
 parser.add_argument('--netD', default='', help="path to netD (to continue training)")
 parser.add_argument('--outf', default=None, help='folder to output images and model checkpoints')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 
 
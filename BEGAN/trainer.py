@@ -1,3 +1,5 @@
+import time
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -6,10 +8,48 @@ import torchvision.utils as vutils
 from torch.autograd import Variable
 
 import models.began as began
+from checkpoint import CheckpointWriter
 
 def L1Loss(a, b):
     return torch.mean(torch.abs(a-b))
 
+class ConvergenceController(object):
+    # tracks the convergence measure averaged over windows of steps. once patience windows in a row
+    # fail to improve on the best one by a relative tol the measure has plateaued: update() returns True
+    # and the sample / checkpoint spacing doubles, up to max_spacing
+    def __init__(self, window, patience, tol, max_spacing=1):
+        self.window = window
+        self.patience = patience
+        self.tol = tol
+        self.max_spacing = max_spacing
+
+        self.measures = []
+        self.best = None
+        self.bad_windows = 0
+        self.plateaus = 0
+        self.spacing = 1
+
+    def update(self, measure):
+        self.measures.append(measure)
+        if len(self.measures) < self.window:
+            return False
+
+        smoothed = sum(self.measures) / len(self.measures)
+        self.measures = []
+        if self.best is None or smoothed < self.best * (1 - self.tol):
+            self.best = smoothed
+            self.bad_windows = 0
+            return False
+
+        self.bad_windows += 1
+        if self.bad_windows < self.patience:
+            return False
+
+        self.bad_windows = 0
+        self.plateaus += 1
+        self.spacing = min(2 * self.spacing, self.max_spacing)
+        return True
+
 def weights_init(m):
     classname = m.__class__.__name__
     if classname.find('Conv') != -1:
@@ -43,10 +83,22 @@ class Trainer(object):
 
         self.lr_update_step = config.lr_update_step
 
+        self.fused_d = config.fused_d
+        self.reuse_fake = config.reuse_fake
+
         self.niter = config.niter
 
+        self.plateau_action = config.plateau_action
+        self.lr_decay = config.lr_decay
+        self.min_lr = config.min_lr
+        self.sample_step = config.sample_step
+        self.controller = ConvergenceController(config.measure_window, config.plateau_patience, config.plateau_tol,
+                                                config.max_spacing if config.adaptive_spacing else 1)
+
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.build_model()
 
         if self.cuda:
@@ -82,8 +134,11 @@ class Trainer(object):
         optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, self.beta2))
 
         k_t = 0
+        lr = self.lr
+        stop = False
 
         for epoch in range(self.niter):
+            start_time = time.time()
             for i, data in enumerate(self.data_loader, 0):
 
                 # train D network
@@ -94,12 +149,16 @@ class Trainer(object):
                 input.resize_as_(real_cpu).copy_(real_cpu)
                 inputv = Variable(input)
 
-                AE_x = self.netD(inputv)
-
                 D_noise.resize_(batch_size, self.nz).normal_(0, 1)
                 D_noisev = Variable(D_noise)
                 D_fake = self.netG(D_noisev)
-                AE_G_d = self.netD(D_fake.detach())
+                if self.fused_d:
+                    # one D pass over real and fake, split for the two reconstruction losses
+                    AE = self.netD(torch.cat([inputv, D_fake.detach()], 0))
+                    AE_x, AE_G_d = AE[:batch_size], AE[batch_size:]
+                else:
+                    AE_x = self.netD(inputv)
+                    AE_G_d = self.netD(D_fake.detach())
 
                 d_loss_real = l1(AE_x, inputv)
                 d_loss_fake = l1(AE_G_d, D_fake.detach())
@@ -110,9 +169,13 @@ class Trainer(object):
                 optimizerD.step()
 
                 #train G network
-                G_noise.resize_(batch_size, self.nz).normal_(0, 1)
-                G_noisev = Variable(G_noise)
-                G_fake = self.netG(G_noisev)
+                if self.reuse_fake:
+                    # the D step fake still holds its graph through netG
+                    G_fake = D_fake
+                else:
+                    G_noise.resize_(batch_size, self.nz).normal_(0, 1)
+                    G_noisev = Variable(G_noise)
+                    G_fake = self.netG(G_noisev)
                 AE_G_g = self.netD(G_fake)
 
                 g_loss = l1(G_fake, AE_G_g)
@@ -121,16 +184,27 @@ class Trainer(object):
                 g_loss.backward()
                 optimizerG.step()
 
-                g_d_balance = (self.gamma * d_loss_real - d_loss_fake).data[0]
+                g_d_balance = (self.gamma * d_loss_real - d_loss_fake).item()
                 k_t += self.lambda_k * g_d_balance
                 k_t = max(min(1, k_t), 0)
 
-                measure = d_loss_real.data[0] + abs(g_d_balance)
+                measure = d_loss_real.item() + abs(g_d_balance)
 
                 print('[%d/%d][%d/%d] Loss_D: %.4f Loss_G: %.4f Measure: %.4f'
                       % (epoch, self.niter, i, len(self.data_loader),
-                         d_loss_fake.data[0], g_loss.data[0], measure))
-                if i % 100 == 0:
+                         d_loss_fake.item(), g_loss.item(), measure))
+
+                if self.controller.update(measure):
+                    print('Measure plateaued at %.4f, sample spacing: %d'
+                          % (self.controller.best, self.controller.spacing))
+                    if self.plateau_action == 'decay':
+                        lr *= self.lr_decay
+                        for param_group in optimizerD.param_groups + optimizerG.param_groups:
+                            param_group['lr'] = lr
+                        print('Learning rate decayed to %g' % lr)
+                    stop = self.plateau_action == 'stop' or lr < self.min_lr
+
+                if i % (self.sample_step * self.controller.spacing) == 0 or stop:
                     vutils.save_image(real_cpu,
                             '%s/real_samples.png' % self.outf,
                             normalize=True)
@@ -139,9 +213,24 @@ class Trainer(object):
                             '%s/fake_samples_epoch_%03d.png' % (self.outf, epoch),
                             normalize=True)
 
+                if stop:
+                    break
+
+            if self.cuda:
+                torch.cuda.synchronize()
+            print('[%d/%d] %.2f steps/s (fused_d: %s, reuse_fake: %s)'
+                  % (epoch, self.niter, (i + 1) / (time.time() - start_time),
+                     self.fused_d, self.reuse_fake))
+
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch)) 
+            if epoch % self.controller.spacing == 0 or epoch == self.niter - 1 or stop:
+                self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                      '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
+            if stop:
+                print('Converged, stopping at epoch %d' % epoch)
+                break
+
+        self.checkpoint.close()
 
 
 
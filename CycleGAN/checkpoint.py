@@ -0,0 +1,76 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+def to_cpu(obj):
+    # a snapshot later optimizer steps cannot change: tensors copied to the cpu, containers rebuilt
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        snapshot = type(obj)((key, to_cpu(value)) for key, value in obj.items())
+        if hasattr(obj, '_metadata'):
+            # state_dict versions, needed by load_state_dict
+            snapshot._metadata = obj._metadata
+        return snapshot
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return obj
+
+
+def write_checkpoint(files):
+    # each file goes to a temporary path first, so a crash never leaves a truncated checkpoint
+    for path, obj in files.items():
+        torch.save(obj, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+
+class CheckpointWriter(object):
+    # writes checkpoints on a background thread. Of the checkpoints written, the last keep_last and
+    # every keep_every-th (counting from the first) are kept and the others removed; keep_last 0 keeps all
+    def __init__(self, keep_last=0, keep_every=0, max_pending=2):
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+
+        self.pool = ThreadPoolExecutor(1)
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.written = []
+        self.count = 0
+
+    def save(self, files):
+        # files: {path: state_dict or any torch.save-able object}, one checkpoint
+        files = {path: to_cpu(obj) for path, obj in files.items()}
+        self.pending.append((self.count, list(files), self.pool.submit(write_checkpoint, files)))
+        self.count += 1
+        while len(self.pending) > self.max_pending:
+            self.wait()
+
+    def wait(self):
+        # checkpoints are written in order, errors of the writer thread surface here
+        count, paths, future = self.pending.popleft()
+        future.result()
+        self.written.append((count, paths))
+        self.prune()
+
+    def prune(self):
+        if self.keep_last <= 0 or len(self.written) <= self.keep_last:
+            return
+
+        old, self.written = self.written[:-self.keep_last], self.written[-self.keep_last:]
+        # a path reused by a newer checkpoint (e.g. netD_epoch_last.pth) belongs to that one
+        in_use = set(path for _, paths in self.written for path in paths)
+        in_use.update(path for _, paths, _ in self.pending for path in paths)
+        for count, paths in old:
+            if self.keep_every > 0 and count % self.keep_every == 0:
+                continue
+            for path in paths:
+                if path not in in_use and os.path.exists(path):
+                    os.remove(path)
+
+    def close(self):
+        while self.pending:
+            self.wait()
+        self.pool.shutdown()
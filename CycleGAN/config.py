@@ -19,10 +19,13 @@ parser.add_argument('--lr', type=float, default=0.0002, help='learning rate, def
 parser.add_argument('--beta1', type=float, default=0.5, help='beta1 for adam. default=0.5')
 parser.add_argument('--beta2', type=float, default=0.999, help='beta2 for adam. default=0.5')
 parser.add_argument('--decay_epoch', type=int, default=100, help='learning rate decay start epoch num')
+parser.add_argument('--cycle_lambda', type=float, default=10, help='weight of the cycle consistency loss')
 parser.add_argument('--cuda', action='store_true', help='enables cuda')
 parser.add_argument('--ngpu', type=int, default=1, help='number of GPUs to use')
 parser.add_argument('--model_path', default='', help="path to saved models (to continue training)")
 parser.add_argument('--outf', default=None, help='folder to output images and model checkpoints')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 def get_config():
     return parser.parse_args()
@@ -6,6 +6,7 @@ from torch.autograd import Variable
 import itertools, time, os
 from glob import glob
 import models.cyclegan as cyclegan
+from checkpoint import CheckpointWriter
 
 
 def weights_init(m):
@@ -31,6 +32,7 @@ class Trainer(object):
         self.ngf = int(config.ngf)
         self.ndf = int(config.ndf)
         self.cuda = config.cuda
+        self.device = torch.device('cuda' if self.cuda else 'cpu')
 
         self.num_steps = len(self.a_data_loader)
         self.batch_size = config.batch_size
@@ -45,16 +47,17 @@ class Trainer(object):
         self.cycle_lambda = config.cycle_lambda
 
         self.outf = config.outf
+
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
         self.sample_step = config.sample_step
         self.checkpoint_step = config.checkpoint_step
 
         self.build_model()
 
-        if self.cuda:
-            self.netG_AB.cuda()
-            self.netD_A.cuda()
-            self.netG_BA.cuda()
-            self.netD_B.cuda()
+        self.netG_AB.to(self.device)
+        self.netD_A.to(self.device)
+        self.netG_BA.to(self.device)
+        self.netD_B.to(self.device)
 
     def load_model(self):
         print("[*] Load models from {}...".format(self.outf))
@@ -79,10 +82,10 @@ class Trainer(object):
         D_B_filename = '{}/netD_B_epoch-{}_step-{}.pth'.format(self.outf, self.start_epoch, self.start_step)
 
 
-        self.netG_AB.load_state_dict(torch.load(G_AB_filename))
-        self.netG_BA.load_state_dict(torch.load(G_BA_filename))
-        self.netD_A.load_state_dict(torch.load(D_A_filename))
-        self.netD_B.load_state_dict(torch.load(D_B_filename))
+        self.netG_AB.load_state_dict(torch.load(G_AB_filename, map_location=self.device))
+        self.netG_BA.load_state_dict(torch.load(G_BA_filename, map_location=self.device))
+        self.netD_A.load_state_dict(torch.load(D_A_filename, map_location=self.device))
+        self.netD_B.load_state_dict(torch.load(D_B_filename, map_location=self.device))
 
 
         print("[*] Model loaded: {}".format(G_AB_filename))
@@ -110,19 +113,18 @@ class Trainer(object):
 
     def train(self):
         MSELoss = nn.MSELoss()
+        # real / fake targets, expanded to the shape of each D output
+        real_target = torch.ones((), device=self.device)
+        fake_target = torch.zeros((), device=self.device)
         L1loss = nn.L1Loss()
 
-        if self.cuda:
-            MSELoss.cuda()
-            L1loss.cuda()
-
         # setup optimizer
         optimizerD_A = optim.Adam(self.netD_A.parameters(), lr=self.lr, betas=(self.beta1, self.beta2))
         optimizerD_B = optim.Adam(self.netD_B.parameters(), lr=self.lr, betas=(self.beta1, self.beta2))
         optimizerG = optim.Adam(itertools.chain(self.netG_AB.parameters(), self.netG_BA.parameters()), lr=self.lr, betas=(self.beta1, self.beta2))
 
         A_loader, B_loader = iter(self.a_data_loader), iter(self.b_data_loader)
-        valid_x_A, valid_x_B = self._get_variable(A_loader.next()), self._get_variable(B_loader.next())
+        valid_x_A, valid_x_B = self._get_variable(next(A_loader)), self._get_variable(next(B_loader))
 
         vutils.save_image(valid_x_A.data, '{}/valid_x_A.png'.format(self.outf), nrow=10)
         vutils.save_image(valid_x_B.data, '{}/valid_x_B.png'.format(self.outf), nrow=10)
@@ -137,16 +139,16 @@ class Trainer(object):
 
             for step in range(self.num_steps):
                 try:
-                    realA, realB = A_loader.next(), B_loader.next()
+                    realA, realB = next(A_loader), next(B_loader)
                 except StopIteration:
                     A_loader, B_loader = iter(self.a_data_loader), iter(self.b_data_loader)
-                    realA, realB = A_loader.next(), B_loader.next()
+                    realA, realB = next(A_loader), next(B_loader)
                 if realA.size(0) != realB.size(0):
                     print("[!] Sampled dataset from A and B have different # of data. Try resampling...")
                     continue
 
                 batch_size = realA.size(0)
-                realA, realB = Variable(realA.cuda()), Variable(realB.cuda())
+                realA, realB = self._get_variable(realA), self._get_variable(realB)
                 ############################
                 # (1) Update G network: minimize Lgan(MSE) + Lcycle(L1)
                 ###########################
@@ -161,12 +163,12 @@ class Trainer(object):
                 # GAN loss: D_B(G_A(A))
                 fakeB = self.netG_AB(realA)
                 output = self.netD_B(fakeB)
-                loss_G_A = MSELoss(output, Variable(torch.ones(output.size()).cuda()))
+                loss_G_A = MSELoss(output, real_target.expand_as(output))
 
                 # GAN loss: D_A(G_B(B))
                 fakeA = self.netG_BA(realB)
                 output = self.netD_A(fakeA)
-                loss_G_B = MSELoss(output, Variable(torch.ones(output.size()).cuda()))
+                loss_G_B = MSELoss(output, real_target.expand_as(output))
 
                 # Forward cycle loss: A <-> G_B(G_A(A))
                 cycleA = self.netG_BA(fakeB)
@@ -195,11 +197,11 @@ class Trainer(object):
                 self.netD_A.zero_grad()
 
                 D_A_real = self.netD_A(realA)
-                loss_D_A_real = MSELoss(D_A_real, Variable(torch.ones(D_A_real.size()).cuda()))
+                loss_D_A_real = MSELoss(D_A_real, real_target.expand_as(D_A_real))
 
                 # train with fake
                 D_A_fake = self.netD_A(fakeA.detach())
-                loss_D_A_fake = MSELoss(D_A_fake, Variable(torch.zeros(D_A_fake.size()).cuda()))
+                loss_D_A_fake = MSELoss(D_A_fake, fake_target.expand_as(D_A_fake))
 
                 loss_D_A = loss_D_A_real + loss_D_A_fake
                 loss_D_A.backward()
@@ -210,11 +212,11 @@ class Trainer(object):
                 self.netD_B.zero_grad()
 
                 D_B_real = self.netD_B(realB)
-                loss_D_B_real = MSELoss(D_B_real, Variable(torch.ones(D_B_real.size()).cuda()))
+                loss_D_B_real = MSELoss(D_B_real, real_target.expand_as(D_B_real))
 
                 # train with fake
                 D_B_fake = self.netD_B(fakeB.detach())
-                loss_D_B_fake = MSELoss(D_B_fake, Variable(torch.zeros(D_B_fake.size()).cuda()))
+                loss_D_B_fake = MSELoss(D_B_fake, fake_target.expand_as(D_B_fake))
 
                 loss_D_B = loss_D_B_real + loss_D_B_fake
                 loss_D_B.backward()
@@ -238,16 +240,16 @@ class Trainer(object):
                                       nrow=10)
 
                 if step% self.checkpoint_step == 0 and step != 0:
-                    torch.save(self.netG_AB.state_dict(), '%s/netG_A_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
-                    torch.save(self.netD_A.state_dict(), '%s/netD_A_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
-                    torch.save(self.netG_BA.state_dict(), '%s/netG_B_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
-                    torch.save(self.netD_B.state_dict(), '%s/netD_B_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
+                    self.checkpoint.save({
+                        '%s/netG_A_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.netG_AB.state_dict(),
+                        '%s/netD_A_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.netD_A.state_dict(),
+                        '%s/netG_B_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.netG_BA.state_dict(),
+                        '%s/netD_B_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.netD_B.state_dict()})
                     print("Saved checkpoint")
 
+        self.checkpoint.close()
+
 
     def _get_variable(self, inputs):
-        if self.ngpu > 0:
-            out = Variable(inputs.cuda())
-        else:
-            out = Variable(inputs)
+        out = Variable(inputs.to(self.device))
         return out
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+
+import torch
+from torch.utils.benchmark import Timer
+
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=64, help='input batch size')
+parser.add_argument('--image_size', type=int, default=64, help='the height / width of the input image to network')
+parser.add_argument('--iters', type=int, default=50, help='timed iterations per setting')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def get_trainer(config, reuse_fake):
+    args = ['--dataset', 'fake', '--batch_size', str(config.batch_size), '--image_size', str(config.image_size)]
+    if not reuse_fake:
+        args.append('--new_fake')
+    if config.cuda:
+        args.append('--cuda')
+    return Trainer(trainer_parser.parse_args(args), None)
+
+
+def bench_reuse_fake(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+    real = torch.rand(config.batch_size, 3, config.image_size, config.image_size, device=device) * 2 - 1
+
+    print("[*] DCGAN train step: new G sample vs reused D step fake, batch %d (%dpx)"
+          % (config.batch_size, config.image_size))
+    # the settings differ by one netG forward per step (under 10% of it); over a handful of iterations the
+    # allocator and thread pool warmup of whichever runs first is larger than that, so keep --iters high
+    for name, reuse_fake in (('new', False), ('reuse', True)):
+        torch.manual_seed(0)
+        trainer = get_trainer(config, reuse_fake)
+
+        step_time = Timer('trainer.train_step(real)', globals=locals(),
+                          num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        print('%-5s - step: %.2f ms, %.2f steps/s' % (name, step_time * 1e3, 1 / step_time))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    bench_reuse_fake(config)
@@ -19,6 +19,9 @@ parser.add_argument('--ngpu', type=int, default=1, help='number of GPUs to use')
 parser.add_argument('--netG', default='', help="path to netG (to continue training)")
 parser.add_argument('--netD', default='', help="path to netD (to continue training)")
 parser.add_argument('--outf', default=None, help='folder to output images and model checkpoints')
+parser.add_argument('--new_fake', action='store_true', help='sample a new fake batch for the G update instead of reusing the D step one')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 def get_config():
     return parser.parse_args()
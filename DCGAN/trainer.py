@@ -5,6 +5,7 @@ import torchvision.utils as vutils
 from torch.autograd import Variable
 
 import models.dcgan as dcgan
+from checkpoint import CheckpointWriter
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -36,6 +37,10 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
+        self.reuse_fake = not config.new_fake
+
         self.build_model()
 
         if self.cuda:
@@ -51,80 +56,75 @@ class Trainer(object):
         self.netD.apply(weights_init)
         if self.config.netD != '':
             self.netD.load_state_dict(torch.load(self.config.netD))
-        
-    def train(self):
-        criterion = nn.BCELoss()
 
-        input = torch.FloatTensor(self.batch_size, 3, self.image_size, self.image_size)
-        noise = torch.FloatTensor(self.batch_size, self.nz, 1, 1)
-        fixed_noise = torch.FloatTensor(self.batch_size, self.nz, 1, 1).normal_(0, 1)
-        label = torch.FloatTensor(self.batch_size)
+        self.criterion = nn.BCELoss()
+
+        # setup optimizer
+        self.optimizerD = optim.Adam(self.netD.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
+        self.optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
+
+    def train_step(self, real):
+        batch_size = real.size(0)
         real_label = 1
         fake_label = 0
 
+        ############################
+        # (1) Update D network: maximize log(D(x)) + log(1 - D(G(z)))
+        ###########################
+        # train with real
+        self.netD.zero_grad()
+        label = torch.full((batch_size,), real_label, dtype=torch.float, device=real.device)
+
+        output = self.netD(real)
+        errD_real = self.criterion(output, label)
+        errD_real.backward()
+        D_x = output.data.mean()
+
+        # train with fake
+        noise = torch.randn(batch_size, self.nz, 1, 1, device=real.device)
+        fake = self.netG(noise)
+        label.fill_(fake_label)
+        output = self.netD(fake.detach())
+        errD_fake = self.criterion(output, label)
+        errD_fake.backward()
+        D_G_z1 = output.data.mean()
+        errD = errD_real + errD_fake
+        self.optimizerD.step()
+
+        ############################
+        # (2) Update G network: maximize log(D(G(z)))
+        ###########################
+        self.netG.zero_grad()
+        label.fill_(real_label)  # fake labels are real for generator cost
+        if not self.reuse_fake:
+            noise = torch.randn(batch_size, self.nz, 1, 1, device=real.device)
+            fake = self.netG(noise)
+        output = self.netD(fake)
+        errG = self.criterion(output, label)
+        errG.backward(inputs=list(self.netG.parameters()))  # no gradients for D's weights
+        D_G_z2 = output.data.mean()
+        self.optimizerG.step()
+
+        return errD, errG, D_x, D_G_z1, D_G_z2
+
+    def train(self):
+        fixed_noise = torch.FloatTensor(self.batch_size, self.nz, 1, 1).normal_(0, 1)
+
         if self.cuda:
-            criterion.cuda()
-            input, label = input.cuda(), label.cuda()
-            noise, fixed_noise = noise.cuda(), fixed_noise.cuda()
+            fixed_noise = fixed_noise.cuda()
 
         fixed_noise = Variable(fixed_noise)
 
-        # setup optimizer
-        optimizerD = optim.Adam(self.netD.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
-        optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
-
         for epoch in range(self.niter):
             for i, data in enumerate(self.data_loader, 0):
-                ############################
-                # (1) Update D network: maximize log(D(x)) + log(1 - D(G(z)))
-                ###########################
-                for p in self.netD.parameters(): # reset requires_grad
-                    p.requires_grad = True # they are set to False below in netG update
-
-                # train with real
-                self.netD.zero_grad()
                 real_cpu, _ = data
-                batch_size = real_cpu.size(0)
                 if self.cuda:
                     real_cpu = real_cpu.cuda()
-                input.resize_as_(real_cpu).copy_(real_cpu)
-                label.resize_(batch_size).fill_(real_label)
-                inputv = Variable(input)
-                labelv = Variable(label)
-
-                output = self.netD(inputv)
-                errD_real = criterion(output, labelv)
-                errD_real.backward()
-                D_x = output.data.mean()
-
-                # train with fake
-                noise.resize_(batch_size, self.nz, 1, 1).normal_(0, 1)
-                noisev = Variable(noise)
-                fake = self.netG(noisev)
-                labelv = Variable(label.fill_(fake_label))
-                output = self.netD(fake.detach())
-                errD_fake = criterion(output, labelv)
-                errD_fake.backward()
-                D_G_z1 = output.data.mean()
-                errD = errD_real + errD_fake
-                optimizerD.step()
-
-                ############################
-                # (2) Update G network: maximize log(D(G(z)))
-                ###########################
-                for p in self.netD.parameters():
-                    p.requires_grad = False # to avoid computation
-                self.netG.zero_grad()
-                labelv = Variable(label.fill_(real_label))  # fake labels are real for generator cost
-                output = self.netD(fake)
-                errG = criterion(output, labelv)
-                errG.backward()
-                D_G_z2 = output.data.mean()
-                optimizerG.step()
+                errD, errG, D_x, D_G_z1, D_G_z2 = self.train_step(real_cpu)
 
                 print('[%d/%d][%d/%d] Loss_D: %.4f Loss_G: %.4f D(x): %.4f D(G(z)): %.4f / %.4f'
                       % (epoch, self.niter, i, len(self.data_loader),
-                         errD.data[0], errG.data[0], D_x, D_G_z1, D_G_z2))
+                         errD.item(), errG.item(), D_x, D_G_z1, D_G_z2))
                 if i % 100 == 0:
                     vutils.save_image(real_cpu,
                             '%s/real_samples.png' % self.outf,
@@ -135,9 +135,7 @@ class Trainer(object):
                             normalize=True)
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch)) 
-
-
-
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
 
+        self.checkpoint.close()
@@ -62,6 +62,8 @@ misc_arg.add_argument('--sample_per_image', type=int, default=64,
 misc_arg.add_argument('--random_seed', type=int, default=123)
 misc_arg.add_argument('--skip_pix2pix_processing', type=str2bool, default=False,
                       help='just for fast debugging in poor cpu machine')
+misc_arg.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+misc_arg.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 def get_config():
     config, unparsed = parser.parse_known_args()
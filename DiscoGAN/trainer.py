@@ -13,6 +13,7 @@ from torch.autograd import Variable
 
 from models import *
 from data_loader import get_loader
+from checkpoint import CheckpointWriter
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -42,6 +43,7 @@ class Trainer(object):
         self.cnn_type = config.cnn_type
 
         self.model_dir = config.model_dir
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
         self.load_path = config.load_path
 
         self.start_step = 0
@@ -259,11 +261,12 @@ class Trainer(object):
             if step % self.save_step == self.save_step - 1:
                 print("[*] Save models to {}...".format(self.model_dir))
 
-                torch.save(self.G_AB.state_dict(), '{}/G_AB_{}.pth'.format(self.model_dir, step))
-                torch.save(self.G_BA.state_dict(), '{}/G_BA_{}.pth'.format(self.model_dir, step))
+                self.checkpoint.save({'{}/G_AB_{}.pth'.format(self.model_dir, step): self.G_AB.state_dict(),
+                                      '{}/G_BA_{}.pth'.format(self.model_dir, step): self.G_BA.state_dict(),
+                                      '{}/D_A_{}.pth'.format(self.model_dir, step): self.D_A.state_dict(),
+                                      '{}/D_B_{}.pth'.format(self.model_dir, step): self.D_B.state_dict()})
 
-                torch.save(self.D_A.state_dict(), '{}/D_A_{}.pth'.format(self.model_dir, step))
-                torch.save(self.D_B.state_dict(), '{}/D_B_{}.pth'.format(self.model_dir, step))
+        self.checkpoint.close()
 
     def generate_with_A(self, inputs, path, idx=None):
         x_AB = self.G_AB(inputs)
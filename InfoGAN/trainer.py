@@ -6,6 +6,7 @@ import torchvision.utils as vutils
 from torch.autograd import Variable
 
 import models.infogan as infogan
+from checkpoint import CheckpointWriter
 
 class log_gaussian:
 
@@ -24,17 +25,32 @@ def weights_init(m):
         m.weight.data.normal_(1.0, 0.02)
         m.bias.data.fill_(0)
 
-def noise_sample(dis_cv, con_cv, noisev, bs, nz):
-    idx = np.random.randint(10, size=bs)
-    c = np.zeros((bs, 10))
-    c[range(bs), idx] = 1.0
+class LatentSampler(object):
+    # z = [noise, 10-way categorical code, 2 continuous codes], sampled on the device into a preallocated buffer
+    def __init__(self, batch_size, nz, device):
+        self.nz = nz
+        self.z = torch.empty(batch_size, nz + 12, device=device)
+        self.idx = torch.empty(batch_size, dtype=torch.long, device=device)
 
-    dis_cv.data.copy_(torch.Tensor(c))
-    con_cv.data.uniform_(-1.0, 1.0)
-    noisev.data.uniform_(-1.0, 1.0)
-    z = torch.cat([noisev, dis_cv, con_cv], 1).view(-1, nz + 12, 1, 1)
+        # fixed grids for visualization: 10 noise vectors x 10 categories x 10 values of c1 (or c2)
+        c = torch.linspace(-1, 1, 10, device=device).repeat(10).view(-1, 1)
+        idx = torch.arange(10, device=device).repeat_interleave(10).view(-1, 1)
+        one_hot = torch.zeros(100, 10, device=device).scatter_(1, idx, 1.0)
+        fixed_noise = torch.empty(100, nz, device=device).uniform_(-1, 1)
 
-    return z, idx
+        self.fixed_c1 = torch.cat([fixed_noise, one_hot, c, torch.zeros_like(c)], 1).view(-1, nz + 12, 1, 1)
+        self.fixed_c2 = torch.cat([fixed_noise, one_hot, torch.zeros_like(c), c], 1).view(-1, nz + 12, 1, 1)
+
+    def sample(self, batch_size):
+        # the buffer is reused: the returned z and con_c are only valid until the next call
+        z = self.z[:batch_size]
+        idx = self.idx[:batch_size].random_(10)
+
+        z[:, :self.nz].uniform_(-1.0, 1.0)
+        z[:, self.nz:self.nz + 10].zero_().scatter_(1, idx.view(-1, 1), 1.0)
+        con_c = z[:, self.nz + 10:].uniform_(-1.0, 1.0)
+
+        return z.view(-1, self.nz + 12, 1, 1), idx, con_c
 
 class Trainer(object):
     def __init__(self, config, data_loader):
@@ -47,6 +63,7 @@ class Trainer(object):
         self.ngf = int(config.ngf)
         self.ndf = int(config.ndf)
         self.cuda = config.cuda
+        self.device = torch.device('cuda' if self.cuda else 'cpu')
 
         self.batch_size = config.batch_size
         self.image_size = config.image_size
@@ -59,6 +76,8 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.build_model()
 
         if self.cuda:
@@ -91,35 +110,17 @@ class Trainer(object):
         criterionQ_con = log_gaussian()
 
         input = torch.FloatTensor(self.batch_size, self.nc, self.image_size, self.image_size)
-        noise = torch.FloatTensor(self.batch_size, self.nz)
-        dis_c = torch.FloatTensor(self.batch_size, 10)
-        con_c = torch.FloatTensor(self.batch_size, 2)
 
         label = torch.FloatTensor(self.batch_size)
         real_label = 1
         fake_label = 0
-        
-        noisev = Variable(noise)
-        dis_cv = Variable(dis_c)
-        con_cv = Variable(con_c)
 
         if self.cuda:
             criterion.cuda()
             criterionQ_dis.cuda()
             input, label = input.cuda(), label.cuda()
-            noisev.data, dis_cv.data, con_cv.data = noisev.data.cuda(), dis_cv.data.cuda(), con_cv.data.cuda()
-
-        c = np.linspace(-1, 1, 10).reshape(1, -1)
-        c = np.repeat(c, 10, 0).reshape(-1, 1)
-
-        c1 = np.hstack([c, np.zeros_like(c)])
-        c2 = np.hstack([np.zeros_like(c), c])
-
-        idx = np.arange(10).repeat(10)
-        one_hot = np.zeros((100, 10))
-        one_hot[range(100), idx] = 1
 
-        fixed_noise = torch.Tensor(100, self.nz).uniform_(-1, 1)
+        latent = LatentSampler(self.batch_size, self.nz, self.device)
 
         # setup optimizer
         optimizerD = optim.Adam([{'params':self.netShareDQ.parameters()}, {'params':self.netD.parameters()}], lr=self.lrD, betas=(self.beta1, 0.999))
@@ -142,10 +143,6 @@ class Trainer(object):
                 input.resize_as_(real_cpu).copy_(real_cpu)
                 label.resize_(batch_size).fill_(real_label)
 
-                noisev.data.resize_(batch_size, self.nz)
-                dis_cv.data.resize_(batch_size, 10)
-                con_cv.data.resize_(batch_size, 2)
-
                 inputv = Variable(input)
                 labelv = Variable(label)
 
@@ -154,8 +151,7 @@ class Trainer(object):
                 errD_real.backward()
                 D_x = output.data.mean()
 
-                noisev.data = noisev.data.normal_(0, 1)
-                z, idx = noise_sample(dis_cv, con_cv, noisev, batch_size, self.nz)
+                z, idx, con_c = latent.sample(batch_size)
 
                 # train with fake
                 fake = self.netG(z)
@@ -181,11 +177,8 @@ class Trainer(object):
                 
                 q_logits, q_mu, q_var = self.netQ(shared_output)
                 
-                class_ = torch.LongTensor(idx).cuda()
-                target = Variable(class_)
-
-                dis_loss = criterionQ_dis(q_logits, target)
-                con_loss = criterionQ_con(con_cv, q_mu, q_var)*0.1
+                dis_loss = criterionQ_dis(q_logits, idx)
+                con_loss = criterionQ_con(con_c, q_mu, q_var)*0.1
 
                 errG = err + dis_loss + con_loss
 
@@ -200,27 +193,18 @@ class Trainer(object):
                     vutils.save_image(real_cpu,
                             '%s/real_samples.png' % self.outf,
                             nrow=10, normalize=True)
-                    noisev.data.copy_(fixed_noise)
-                    dis_cv.data.copy_(torch.Tensor(one_hot))
-
-                    con_cv.data.copy_(torch.from_numpy(c1))
-                    z = torch.cat([noisev, dis_cv, con_cv], 1).view(-1, self.nz + 12, 1, 1)
-                    fake = self.netG(z)
+                    fake = self.netG(latent.fixed_c1)
                     vutils.save_image(fake.data,
                             '%s/fake_samples_c1_epoch_%03d.png' % (self.outf, epoch),
                             nrow=10)
 
-                    con_cv.data.copy_(torch.from_numpy(c2))
-                    z = torch.cat([noisev, dis_cv, con_cv], 1).view(-1, self.nz + 12, 1, 1)
-                    fake = self.netG(z)
+                    fake = self.netG(latent.fixed_c2)
                     vutils.save_image(fake.data,
                             '%s/fake_samples_c2_epoch_%03d.png' % (self.outf, epoch),
                             nrow=10)
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch)) 
-
-
-
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
 
+        self.checkpoint.close()
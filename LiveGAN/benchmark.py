@@ -0,0 +1,227 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+from torch.utils.benchmark import Timer
+from torch.utils.data import DataLoader
+
+from models import mocogan as mocogan
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=10, help='number of videos sampled per iteration')
+parser.add_argument('--image_size', type=int, default=64, help='resize all frames to this size')
+parser.add_argument('--n_channels', type=int, default=3, help='number of channels in the input data')
+parser.add_argument('--video_length', type=int, default=10, help='length of the video')
+parser.add_argument('--ngf', type=int, default=64, help='generator width')
+parser.add_argument('--dim_z_content', type=int, default=50, help='dimensionality of the content input, ie hidden space')
+parser.add_argument('--dim_z_motion', type=int, default=10, help='dimensionality of the motion input')
+parser.add_argument('--dim_z_category', type=int, default=5, help='dimensionality of categorical input')
+parser.add_argument('--iters', type=int, default=10, help='timed iterations per setting')
+parser.add_argument('--seq_video_lengths', type=int, nargs='+', default=[10, 16], help='video lengths for the seq benchmark')
+parser.add_argument('--train_batch_size', type=int, default=2, help='batch size for the train benchmark')
+parser.add_argument('--train_steps', type=int, default=2, help='steps for the train benchmark')
+parser.add_argument('--bench', nargs='+', default=['skip', 'encode', 'seq', 'train'], help='benchmarks to run: skip, encode, seq, train')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def decode_repeat(generator, z, z_content1, z_content2, z_content3, z_content4, video_len):
+    # reference: skip features replicated video_len times with torch.cat before every decoder stage
+    z_content1, z_content2, z_content3, z_content4 = [
+        torch.cat([content.unsqueeze(1)] * video_len, dim=1).view(-1, content.size(1), content.size(2), content.size(3))
+        for content in (z_content1, z_content2, z_content3, z_content4)]
+
+    h = generator.main1(z.view(z.size(0), z.size(1), 1, 1))
+    h = generator.main2(torch.cat([h, z_content4], dim=1))
+    h = generator.main3(torch.cat([h, z_content3], dim=1))
+    h = generator.main4(torch.cat([h, z_content2], dim=1))
+    h = generator.main5(torch.cat([h, z_content1], dim=1))
+    return h
+
+
+def seq_forward_loop(discriminator, gif):
+    # reference: per-frame encoder calls, first frame repeated video_len times
+    gif = gif.permute(0, 2, 1, 3, 4)
+    video_len = gif.size(1)
+
+    def z_dynamics(frames):
+        h_0 = frames.new(frames.size(1), discriminator.dim_z_motion).normal_()
+        h_t = [discriminator.rnn(h_0, discriminator.encoder(frames[i]).squeeze()) for i in range(video_len)]
+        return torch.cat([h_k.view(-1, 1, discriminator.dim_z_motion) for h_k in h_t], dim=1).view(-1, discriminator.dim_z_motion)
+
+    im_gif = torch.cat([gif[:, :1]] * video_len, dim=1).permute(1, 0, 2, 3, 4)
+    z_d = z_dynamics(gif.permute(1, 0, 2, 3, 4)) - z_dynamics(im_gif)
+
+    return discriminator.discriminator(z_d)
+
+
+def peak_memory(fn, cuda):
+    # cuda: peak allocated bytes; cpu: bytes of the tensors autograd keeps alive for backward
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn()
+
+    return sum(storages.values())
+
+
+def get_generator(config):
+    generator = mocogan.VideoGenerator(config.n_channels, config.dim_z_content, config.dim_z_category,
+                                       config.dim_z_motion, config.video_length, ngf=config.ngf)
+    if config.cuda:
+        generator.cuda()
+    return generator
+
+
+def bench_skip(config):
+    generator = get_generator(config)
+    device = generator.recurrent.weight_ih.device
+
+    images = torch.randn(config.batch_size, config.n_channels, config.image_size, config.image_size, device=device)
+    categories = torch.randint(config.dim_z_category, (config.batch_size,))
+    z, _, z_content1, z_content2, z_content3, z_content4 = generator.sample_z_video(images, categories,
+                                                                                 config.batch_size)
+    z = z.detach()
+    contents = (z_content1, z_content2, z_content3, z_content4)
+
+    def repeat():
+        decode_repeat(generator, z, *contents, video_len=config.video_length).mean().backward()
+
+    def broadcast():
+        generator.decode(z, *contents, video_len=config.video_length).mean().backward()
+
+    print("[*] VideoGenerator decoder: torch.cat skip replication vs broadcast skips (forward + backward)")
+    for name, fn in (('repeat', repeat), ('broadcast', broadcast)):
+        step_time = Timer('fn()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        memory = peak_memory(fn, config.cuda)
+        print('%-9s - time: %.2f ms, peak memory: %.1f MB' % (name, step_time * 1e3, memory / 2 ** 20))
+
+
+def bench_encode(config):
+    generator = get_generator(config)
+    device = generator.recurrent.weight_ih.device
+
+    images = torch.randn(config.batch_size, config.n_channels, config.image_size, config.image_size, device=device)
+    categories = torch.randint(config.dim_z_category, (config.batch_size,))
+
+    def separate():
+        fake = (generator.sample_videos(images, categories, config.batch_size),
+                generator.sample_images(images, categories, config.batch_size))
+        (fake[0][0].mean() + fake[1][0].mean()).backward()
+
+    def encode_once():
+        encoded = generator.encode(images, categories, config.batch_size)
+        fake = (generator.decode_videos(encoded), generator.decode_images(encoded, config.batch_size))
+        (fake[0][0].mean() + fake[1][0].mean()).backward()
+
+    def encoders():
+        generator.sample_z_content(images, config.batch_size)
+        generator.sample_z_m(images, config.batch_size)
+
+    encoder_time = Timer('encoders()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+
+    print("[*] VideoGenerator step: sample_videos + sample_images vs encode once (forward + backward)")
+    for name, fn, n_encodes in (('separate', separate, 2), ('encode', encode_once, 1)):
+        step_time = Timer('fn()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        print('%-9s - time: %.2f ms, encoder forward: %.2f ms' % (name, step_time * 1e3, n_encodes * encoder_time * 1e3))
+
+
+def bench_seq(config):
+    print("[*] SequenceDiscriminator step: per-frame loop vs batched frames (forward + backward)")
+    for video_len in config.seq_video_lengths:
+        discriminator = mocogan.SequenceDiscriminator(config.n_channels, video_len, config.dim_z_motion)
+        if config.cuda:
+            discriminator.cuda()
+        device = discriminator.rnn.weight_ih.device
+
+        gif = torch.randn(config.batch_size, config.n_channels, video_len, config.image_size, config.image_size,
+                          device=device)
+
+        def loop():
+            seq_forward_loop(discriminator, gif).mean().backward()
+
+        def batched():
+            discriminator(gif)[0].mean().backward()
+
+        loop_time = Timer('loop()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        batched_time = Timer('batched()', globals=locals(),
+                             num_threads=torch.get_num_threads()).timeit(config.iters).mean
+
+        print('video_len: %3d - loop: %.2f ms, batched: %.2f ms, speedup: %.2fx'
+              % (video_len, loop_time * 1e3, batched_time * 1e3, loop_time / batched_time))
+
+
+class SyntheticVideos(torch.utils.data.Dataset):
+    # random clips or frames in the format of data_loader's datasets
+    def __init__(self, shape, n_categories, length):
+        self.shape = shape
+        self.n_categories = n_categories
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return {'images': torch.rand(self.shape) * 2 - 1, 'categories': i % self.n_categories}
+
+
+def bench_train(config):
+    # Trainer.train() end to end on synthetic data: G and D steps, samples and checkpoints.
+    # The video length is the trainer's default, which the categorical video discriminator expects
+    args = ['--dataroot', '', '--image_batch', str(config.train_batch_size), '--video_batch', str(config.train_batch_size),
+            '--batches', '1', '--log_interval', '1', '--checkpoint_step', '1',
+            '--dim_z_content', str(config.dim_z_content), '--dim_z_motion', str(config.dim_z_motion),
+            '--dim_z_category', str(config.dim_z_category)]
+    if config.cuda:
+        args.append('--cuda')
+    trainer_config = trainer_parser.parse_args(args)
+    trainer_config.outf = tempfile.mkdtemp()
+    trainer_config.manual_seed = 0
+
+    length = config.train_batch_size * config.train_steps
+    image_loader = DataLoader(SyntheticVideos((3, 64, 64), config.dim_z_category, length),
+                              batch_size=config.train_batch_size, drop_last=True)
+    video_loader = DataLoader(SyntheticVideos((3, trainer_config.video_length, 64, 64), config.dim_z_category, length),
+                              batch_size=config.train_batch_size, drop_last=True)
+
+    print("[*] Trainer.train(): %d steps, batch %d, video length %d"
+          % (config.train_steps, config.train_batch_size, trainer_config.video_length))
+    trainer = Trainer(trainer_config, image_loader, video_loader)
+    start_time = time.time()
+    trainer.train()
+    step_time = (time.time() - start_time) / config.train_steps
+    print('step: %.2f s, wrote %s' % (step_time, ', '.join(sorted(os.listdir(trainer_config.outf)))))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+
+    if 'skip' in config.bench:
+        bench_skip(config)
+    if 'encode' in config.bench:
+        bench_encode(config)
+    if 'seq' in config.bench:
+        bench_seq(config)
+    if 'train' in config.bench:
+        bench_train(config)
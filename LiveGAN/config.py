@@ -40,6 +40,8 @@ parser.add_argument('--dim_z_category', type=int, default=5, help='dimensionalit
 
 parser.add_argument('--cuda', action='store_true', help='enables cuda')
 parser.add_argument('--outf', default=None, help='folder to output images and videos ans model checkpoints')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 def get_config():
     return parser.parse_args()
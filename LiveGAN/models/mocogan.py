@@ -1,15 +1,18 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.nn.parallel
 import torch.utils.data
 from torch.autograd import Variable
 
 import numpy as np
 
-if torch.cuda.is_available():
-    T = torch.cuda
-else:
-    T = torch
+def gru_sequence(cell, input, h_0):
+    # input: bs, len, input_size -> h_t: bs, len, hidden_size
+    # runs the fused GRU kernel (the one nn.GRU dispatches to) with the parameters of an nn.GRUCell
+    weights = [cell.weight_ih, cell.weight_hh, cell.bias_ih, cell.bias_hh]
+    h_t, _ = torch.gru(input, h_0.unsqueeze(0), weights, True, 1, 0.0, cell.training, False, True)
+    return h_t
 
 
 class Noise(nn.Module):
@@ -18,12 +21,45 @@ class Noise(nn.Module):
         self.use_noise = use_noise
         self.sigma = sigma
 
+        self.seed = None
+        self.rng = None
+        # noise is drawn in place into a buffer that is reused while the input shape stays the same
+        self.register_buffer('noise', None, persistent=False)
+
+    def manual_seed(self, seed):
+        self.seed = seed
+        self.rng = None
+
+    def get_rng(self, device):
+        if self.seed is None:
+            return None
+
+        if self.rng is None or self.rng.device != device:
+            self.rng = torch.Generator(device=device)
+            self.rng.manual_seed(self.seed)
+
+        return self.rng
+
     def forward(self, x):
-        if self.use_noise:
-            return x + self.sigma * Variable(T.FloatTensor(x.size()).normal_(), requires_grad=False)
+        # instance noise is a training regularizer: skipped in eval mode
+        if self.use_noise and self.training:
+            if self.noise is None or self.noise.shape != x.shape or self.noise.device != x.device \
+                    or self.noise.dtype != x.dtype:
+                self.noise = torch.empty_like(x, memory_format=torch.contiguous_format)
+
+            self.noise.normal_(generator=self.get_rng(x.device))
+            return torch.add(x, self.noise, alpha=self.sigma)
         return x
 
 
+def seed_noise(modules, seed):
+    # gives every Noise layer of the given modules its own reproducible stream. seed itself is left
+    # to the global RNG: the layers take seed + 1, seed + 2, ...
+    noise_layers = [m for module in modules for m in module.modules() if isinstance(m, Noise)]
+    for i, noise in enumerate(noise_layers):
+        noise.manual_seed(seed + 1 + i)
+
+
 class ImageDiscriminator(nn.Module):
     def __init__(self, n_channels, ndf=64, use_noise=False, noise_sigma=None):
         super(ImageDiscriminator, self).__init__()
@@ -216,49 +252,41 @@ class SequenceDiscriminator(nn.Module):
             nn.Sigmoid()
         )
 
-    def z_dynamics(self, gif):
-        video_len = gif.size(0)
-        batch_size = gif.size(1)
-        # input: len, bs, nc, 64, 64
+    def encode_frames(self, gif):
+        # gif: bs, len, nc, 64, 64
+        batch_size, video_len = gif.size(0), gif.size(1)
 
-        h_0 = Variable(T.FloatTensor(batch_size, self.dim_z_motion).normal_())
-        h_t = []
+        e_t = self.encoder(gif.reshape(batch_size * video_len, gif.size(2), gif.size(3), gif.size(4)))
+        # e_t: bs * len, dim z motion, 1, 1 (all frames in one batch)
 
-        for i in range(video_len):
-            e_t = self.encoder(gif[i]).squeeze()
-            # e_t: bs, dim_z_motion
-            ht = self.rnn(h_0, e_t)
-            h_t.append(ht)
+        return e_t.view(batch_size, video_len, self.dim_z_motion)
 
-        # h_t: len, bs, dim z motion
+    def z_dynamics(self, e_t):
+        # e_t: bs, len, dim z motion
+        # every frame is stepped from the same random initial state
+        h_0 = Variable(e_t.data.new(e_t.size(0), 1, self.dim_z_motion).normal_())
+        h_0 = h_0.expand_as(e_t)
 
-        z_d_t = [h_k.view(-1, 1, self.dim_z_motion) for h_k in h_t]
-        z_d = torch.cat(z_d_t, dim=1)
-        # z_d: bs, len, dim z motion
-        z_d = z_d.contiguous().view(-1, self.dim_z_motion)
-        # z_d: bs * len, dim z motion
+        h_t = self.rnn(h_0.reshape(-1, self.dim_z_motion), e_t.reshape(-1, self.dim_z_motion))
+        # h_t: bs * len, dim z motion
 
-        return z_d
+        return h_t.view_as(e_t)
 
     def forward(self, gif):
         # input: bs, 3, len, 64, 64
         gif = gif.permute(0, 2, 1, 3, 4)
         # gif: bs, len, 3, 64, 64
 
-        f1 = gif[:, 0, :, :, :]
-        # f1: bs, 3, 64, 64
-        im_gif = f1.contiguous().view(gif.size(0), 1, self.n_channels, gif.size(3), gif.size(4))
-        im_gif = torch.cat([im_gif] * gif.size(1), dim=1)  # bs, len, nc, 64, 64
-        im_gif = im_gif.permute(1, 0, 2, 3, 4)
-
-        video = gif.permute(1, 0, 2, 3, 4)
+        e_t = self.encode_frames(gif)
 
-        dynamics = self.z_dynamics(video)
-        spacial = self.z_dynamics(im_gif)
-        # size: bs, dim_z_m
+        dynamics = self.z_dynamics(e_t)
+        # the first frame repeated over the video embeds to the same vector every frame:
+        # step it once and broadcast over len
+        spacial = self.z_dynamics(e_t[:, :1])
+        # size: bs, 1, dim_z_m
 
-        z_d = dynamics - spacial
-        # z_d: bs, len, dim z motion
+        z_d = (dynamics - spacial).view(-1, self.dim_z_motion)
+        # z_d: bs * len, dim z motion
 
         output = self.discriminator(z_d)
 
@@ -266,6 +294,23 @@ class SequenceDiscriminator(nn.Module):
 
 
 
+class EncodedImages(object):
+    # encoder outputs of an image batch, computed once by VideoGenerator.encode. decode_videos and
+    # decode_images each run the motion GRU from them with their own noise, so the fake videos
+    # and the fake frames stay independent samples
+    def __init__(self, z_content, z_category, z_category_labels, motion, z_content1, z_content2, z_content3,
+                 z_content4, video_len):
+        self.z_content = z_content
+        self.z_category = z_category
+        self.z_category_labels = z_category_labels
+        self.motion = motion
+        self.z_content1 = z_content1
+        self.z_content2 = z_content2
+        self.z_content3 = z_content3
+        self.z_content4 = z_content4
+        self.video_len = video_len
+
+
 class VideoGenerator(nn.Module):
     def __init__(self, n_channels, dim_z_content, dim_z_category, dim_z_motion,
                  video_length, ngf=64):
@@ -354,125 +399,143 @@ class VideoGenerator(nn.Module):
         #h_t = [self.get_gru_initial_state(num_samples)]
         
         motion = self.encoder_motion(image_batches).view(num_samples, self.dim_z_motion)
-        h_t = [motion]
+        # z_m: bs * len, dim z motion
+        return self.sample_motion(motion, video_len).reshape(-1, self.dim_z_motion)
 
-        for frame_num in range(video_len):
-            e_t = self.get_iteration_noise(num_samples)
-            h_t.append(self.recurrent(e_t, h_t[-1]))
-
-        z_m_t = [h_k.view(-1, 1, self.dim_z_motion) for h_k in h_t]
-        z_m = torch.cat(z_m_t[1:], dim=1).view(-1, self.dim_z_motion)
-
-        return z_m
+    def sample_motion(self, motion, video_len):
+        # motion: bs, dim z motion (the encoded initial state) -> bs, len, dim z motion,
+        # a strided view of the GRU output, which torch.cat reads without a copy
+        e_t = self.get_iteration_noise(motion.size(0), video_len)
+        return gru_sequence(self.recurrent, e_t, motion)
 
     def sample_z_categ(self, num_samples, video_len, categories):
         video_len = video_len if video_len is not None else self.video_length
 
-        #classes_to_generate = np.random.randint(self.dim_z_category, size=num_samples)
-        classes_to_generate = categories
-        one_hot = np.zeros((num_samples, self.dim_z_category), dtype=np.float32)
-        one_hot[np.arange(num_samples), classes_to_generate] = 1
-        one_hot_video = np.repeat(one_hot, video_len, axis=0)
+        device = self.get_device()
 
-        one_hot_video = torch.from_numpy(one_hot_video)
-
-        if torch.cuda.is_available():
-            one_hot_video = one_hot_video.cuda()
+        classes_to_generate = categories.view(num_samples).long().to(device)
+        one_hot = torch.zeros(num_samples, 1, self.dim_z_category, device=device)
+        one_hot.scatter_(2, classes_to_generate.view(num_samples, 1, 1), 1)
+        one_hot_video = one_hot.expand(num_samples, video_len, self.dim_z_category)
+        # one_hot_video: bs, len, dim z category (broadcast over len)
 
         return Variable(one_hot_video), classes_to_generate
 
     def sample_z_content(self, image_batches, num_samples, video_len=None):
         video_len = video_len if video_len is not None else self.video_length
 
-        #content = np.random.normal(0, 1, (num_samples, self.dim_z_content)).astype(np.float32)
         content1 = self.encoder_content1(image_batches)
         content2 = self.encoder_content2(content1)
         content3 = self.encoder_content3(content2)
         content4 = self.encoder_content4(content3)
         content = self.encoder_content5(content4)
-        
-        #content = content.data.view(num_samples, self.dim_z_content)
-        #content = torch.cat([content] * 10)
+
+        # skip features stay per clip (bs, c, h, w); decode_skip broadcasts them over the frames
         content = content.data.view(num_samples, 1, self.dim_z_content)
-        content = torch.cat([content] * video_len, dim=1)
-        content = content.view(num_samples * video_len, content.size(2))
+        content = content.expand(num_samples, video_len, self.dim_z_content)
+        # content: bs, len, dim z content (broadcast over len)
 
-        content4 = content4.data.view(num_samples, 1, self.ngf*8, content4.size(2), content4.size(3))
-        content4 = torch.cat([content4] * video_len, dim=1)
-        content4 = content4.view(num_samples * video_len, content4.size(2), content4.size(3), content4.size(4))
+        return Variable(content), Variable(content1.data), Variable(content2.data), Variable(content3.data), Variable(content4.data)
 
-        content3 = content3.data.view(num_samples, 1, self.ngf*4, content3.size(2), content3.size(3))
-        content3 = torch.cat([content3] * video_len, dim=1)
-        content3 = content3.view(num_samples * video_len, content3.size(2), content3.size(3), content3.size(4))
+    def sample_z_video(self, image_batches, categories, num_samples, video_len=None):
+        video_len = video_len if video_len is not None else self.video_length
 
-        content2 = content2.data.view(num_samples, 1, self.ngf*2, content2.size(2), content2.size(3))
-        content2 = torch.cat([content2] * video_len, dim=1)
-        content2 = content2.view(num_samples * video_len, content2.size(2), content2.size(3), content2.size(4))
+        z_content, z_content1, z_content2, z_content3, z_content4 = self.sample_z_content(image_batches, num_samples, video_len)
 
-        content1 = content1.data.view(num_samples, 1, self.ngf, content1.size(2), content1.size(3))
-        content1 = torch.cat([content1] * video_len, dim=1)
-        content1 = content1.view(num_samples * video_len, content1.size(2), content1.size(3), content1.size(4))
+        z_category, z_category_labels = self.sample_z_categ(num_samples, video_len, categories)
 
-        #content = torch.from_numpy(content)
-        #if torch.cuda.is_available():
-        #    content = content.cuda()
-        return Variable(content), Variable(content1), Variable(content2), Variable(content3), Variable(content4)
+        motion = self.encoder_motion(image_batches).view(num_samples, self.dim_z_motion)
+        z_motion = self.sample_motion(motion, video_len)
 
-    def sample_z_video(self, image_batches, categories, num_samples, video_len=None):
-        z_content, z_content1, z_content2, z_content3, z_content4 = self.sample_z_content(image_batches, num_samples, video_len)
-        
-        z_category, z_category_labels = self.sample_z_categ(num_samples, video_len, categories)
-        
-        z_motion = self.sample_z_m(image_batches, num_samples, video_len)
-        
-        z = torch.cat([z_content, z_category, z_motion], dim=1)
+        z = torch.cat([z_content, z_category, z_motion], dim=2)
+        z = z.view(num_samples * video_len, z.size(2))
 
         return z, z_category_labels, z_content1, z_content2, z_content3, z_content4
 
-    def sample_videos(self, image_batches, categories, num_samples, video_len=None):
-        video_len = video_len if video_len is not None else self.video_length
+    def decode_skip(self, main, h, skip, video_len):
+        # same as main(torch.cat([h, skip], dim=1)) with skip repeated video_len times per clip:
+        # the transposed conv is split along its input channels and the skip half runs once per clip,
+        # adding the bias (if any) once to the sum
+        deconv = main[0]
+        n_h = h.size(1)
+
+        out = F.conv_transpose2d(h, deconv.weight[:n_h], None, deconv.stride, deconv.padding,
+                                 deconv.output_padding, deconv.groups, deconv.dilation)
+        out_skip = F.conv_transpose2d(skip, deconv.weight[n_h:], deconv.bias, deconv.stride, deconv.padding,
+                                      deconv.output_padding, deconv.groups, deconv.dilation)
+
+        out = out.view(skip.size(0), video_len, out.size(1), out.size(2), out.size(3)) + out_skip.unsqueeze(1)
+        out = out.view(-1, out.size(2), out.size(3), out.size(4))
 
-        z, z_category_labels, z_content1, z_content2, z_content3, z_content4 = self.sample_z_video(image_batches, categories, num_samples, video_len)
+        for layer in main[1:]:
+            out = layer(out)
+        return out
 
+    def decode(self, z, z_content1, z_content2, z_content3, z_content4, video_len):
         h = self.main1(z.view(z.size(0), z.size(1), 1, 1))
-        h = self.main2(torch.cat([h, z_content4], dim=1))
-        h = self.main3(torch.cat([h, z_content3], dim=1))
-        h = self.main4(torch.cat([h, z_content2], dim=1))
-        h = self.main5(torch.cat([h, z_content1], dim=1))
+        h = self.decode_skip(self.main2, h, z_content4, video_len)
+        h = self.decode_skip(self.main3, h, z_content3, video_len)
+        h = self.decode_skip(self.main4, h, z_content2, video_len)
+        h = self.decode_skip(self.main5, h, z_content1, video_len)
+        return h
+
+    def encode(self, image_batches, categories, num_samples, video_len=None):
+        video_len = video_len if video_len is not None else self.video_length
+
+        z_content, z_content1, z_content2, z_content3, z_content4 = self.sample_z_content(image_batches, num_samples, video_len)
+        z_category, z_category_labels = self.sample_z_categ(num_samples, video_len, categories)
+        motion = self.encoder_motion(image_batches).view(num_samples, self.dim_z_motion)
+
+        return EncodedImages(z_content, z_category, z_category_labels, motion,
+                             z_content1, z_content2, z_content3, z_content4, video_len)
+
+    def sample_z_encoded(self, encoded):
+        # bs * len, dim z: the encoded content and category with a new motion sample
+        z_motion = self.sample_motion(encoded.motion, encoded.video_len)
+        z = torch.cat([encoded.z_content, encoded.z_category, z_motion], dim=2)
+        return z.view(-1, z.size(2))
+
+    def decode_videos(self, encoded):
+        video_len = encoded.video_len
+
+        z = self.sample_z_encoded(encoded)
+        h = self.decode(z, encoded.z_content1, encoded.z_content2, encoded.z_content3, encoded.z_content4, video_len)
         h = h.view(int(h.size(0) / video_len), video_len, self.n_channels, h.size(3), h.size(3))
         h = h.permute(0, 2, 1, 3, 4)
-        #z_category_labels = torch.from_numpy(z_category_labels).type("torch.LongTensor")
-        z_category_labels = z_category_labels.type("torch.LongTensor")
 
-        if torch.cuda.is_available():
-            z_category_labels = z_category_labels.cuda()
+        return h, Variable(encoded.z_category_labels, requires_grad=False)
 
-        return h, Variable(z_category_labels, requires_grad=False)
-
-    def sample_images(self, image_batches, categories, num_samples):
-        #z, z_category_labels = self.sample_z_video(image_batches, num_samples * self.video_length * 2)
-        z, z_category_labels, z_content1, z_content2, z_content3, z_content4 = self.sample_z_video(image_batches, categories, num_samples)
+    def decode_images(self, encoded, num_samples):
+        z = self.sample_z_encoded(encoded)
 
-        j = np.sort(np.random.choice(z.size(0), num_samples, replace=False)).astype(np.int64)
+        # num_samples distinct frames, in order
+        j, _ = torch.sort(torch.randperm(z.size(0), device=z.device)[:num_samples])
         z = z[j, ::]
-        z = z.view(z.size(0), z.size(1), 1, 1)
-        z_content4 = z_content4[j, ::]
-        z_content3 = z_content3[j, ::]
-        z_content2 = z_content2[j, ::]
-        z_content1 = z_content1[j, ::]
-        h = self.main1(z)
-        h = self.main2(torch.cat([h, z_content4], dim=1))
-        h = self.main3(torch.cat([h, z_content3], dim=1))
-        h = self.main4(torch.cat([h, z_content2], dim=1))
-        h = self.main5(torch.cat([h, z_content1], dim=1))
+        # frame j belongs to clip j // video_len
+        clip = j // encoded.video_len
+        z_content4 = encoded.z_content4[clip, ::]
+        z_content3 = encoded.z_content3[clip, ::]
+        z_content2 = encoded.z_content2[clip, ::]
+        z_content1 = encoded.z_content1[clip, ::]
+        h = self.decode(z, z_content1, z_content2, z_content3, z_content4, 1)
 
         return h, None
 
+    def sample_videos(self, image_batches, categories, num_samples, video_len=None):
+        return self.decode_videos(self.encode(image_batches, categories, num_samples, video_len))
+
+    def sample_images(self, image_batches, categories, num_samples):
+        #z, z_category_labels = self.sample_z_video(image_batches, num_samples * self.video_length * 2)
+        return self.decode_images(self.encode(image_batches, categories, num_samples), num_samples)
+
+    def get_device(self):
+        return self.recurrent.weight_ih.device
+
     def get_gru_initial_state(self, num_samples):
-        return Variable(T.FloatTensor(num_samples, self.dim_z_motion).normal_())
+        return Variable(torch.randn(num_samples, self.dim_z_motion, device=self.get_device()))
 
-    def get_iteration_noise(self, num_samples):
-        return Variable(T.FloatTensor(num_samples, self.dim_z_motion).normal_())
+    def get_iteration_noise(self, num_samples, video_len):
+        return Variable(torch.randn(num_samples, video_len, self.dim_z_motion, device=self.get_device()))
 
 class ImageReconstructor(nn.Module):
     def __init__(self, n_channels, dim_z, ngf=64):
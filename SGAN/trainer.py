@@ -7,6 +7,7 @@ import torch.nn.functional as F
 
 
 import models.sgan as sgan
+from checkpoint import CheckpointWriter
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -40,6 +41,8 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.build_model()
 
         if self.cuda:
@@ -153,9 +156,7 @@ class Trainer(object):
                             normalize=True)
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch)) 
-
-
-
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
 
+        self.checkpoint.close()
@@ -0,0 +1,84 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+
+import torch
+from torch.utils.benchmark import Timer
+
+import models.stageI as stageI
+import models.stageII as stageII
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=8, help='input batch size')
+parser.add_argument('--text_dim', type=int, default=1024)
+parser.add_argument('--nz', type=int, default=100, help='size of the latent z vector')
+parser.add_argument('--nef', type=int, default=128)
+parser.add_argument('--ngf', type=int, default=64)
+parser.add_argument('--r_num', type=int, default=2)
+parser.add_argument('--iters', type=int, default=5, help='timed iterations per setting')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def peak_memory(fn, cuda):
+    # cuda: peak allocated bytes; cpu: bytes of the tensors autograd keeps alive for backward
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn()
+
+    return sum(storages.values())
+
+
+def bench_stageI_fast(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+    txt_embedding = torch.randn(config.batch_size, config.text_dim, device=device)
+    noise = torch.randn(config.batch_size, config.nz, device=device)
+
+    settings = [('module', None), ('fast', False)]
+    if not config.cuda:
+        settings.append(('fast bf16', True))
+
+    print("[*] StageII netG step with the frozen stageI_G: module vs inference fast path (forward + backward)")
+    for name, bf16 in settings:
+        stageI_G = stageI._netG(config.text_dim, config.nz, config.nef, config.ngf, config.cuda)
+        netG = stageII._netG(stageI_G, config.text_dim, config.nz, config.nef, config.ngf, config.r_num,
+                             config.cuda).to(device)
+        if bf16 is not None:
+            netG.freeze_stage1(bf16)
+
+        def step():
+            _, fake_imgs, mu, logvar = netG(txt_embedding, noise)
+            fake_imgs.mean().backward()
+
+        def stage1():
+            if netG.stage1_fast is not None:
+                return netG.stage1_fast(txt_embedding, noise)
+            return netG.STAGE1_G(txt_embedding, noise)[1]
+
+        step_time = Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        stage1_time = Timer('stage1()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        memory = peak_memory(step, config.cuda)
+
+        print('%-9s - step: %.2f ms, stageI_G: %.2f ms, peak memory: %.1f MB'
+              % (name, step_time * 1e3, stage1_time * 1e3, memory / 2 ** 20))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    bench_stageI_fast(config)
@@ -27,9 +27,17 @@ parser.add_argument('--cuda', action='store_true', help='enables cuda')
 parser.add_argument('--ngpu', type=int, default=1, help='number of GPUs to use')
 parser.add_argument('--netG', default='', help="path to netG (to continue training)")
 parser.add_argument('--stageI_G', default='', help="path to stageI_G (to continue training)")
+parser.add_argument('--stageI_fast', action='store_true', help='run the frozen stageI_G in inference mode with BatchNorm folded (stage 2)')
+parser.add_argument('--stageI_bf16', action='store_true', help='with --stageI_fast, run stageI_G in bf16 on cpu')
 parser.add_argument('--netD', default='', help="path to netD (to continue training)")
 parser.add_argument('--outf', default=None, help='folder to output images and model checkpoints')
+parser.add_argument('--num_samples', type=int, default=0, help='number of images to sample, 0 for one per sentence')
+parser.add_argument('--shard_size', type=int, default=1000, help='number of sampled images per shard')
+parser.add_argument('--shard_format', default='tar', help='tar (png images) | npz (uint8 array)')
+parser.add_argument('--sample_workers', type=int, default=4, help='number of threads encoding sample shards')
 parser.add_argument('--coeff_KL', type=int, default=2.0, help='coefficient for KL divergence')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 
 def get_config():
@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import torch.nn.parallel
 from torch.autograd import Variable
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
 
 def conv3x3(in_planes, out_planes, stride=1):
     "3x3 convolution with padding"
@@ -9,6 +10,22 @@ def conv3x3(in_planes, out_planes, stride=1):
                      padding=1, bias=False)
 
 
+def fold_bn(module):
+    "fold eval-mode BatchNorm layers into the conv / linear layer right before them"
+    for seq in [m for m in module.modules() if isinstance(m, nn.Sequential)]:
+        names = list(seq._modules.keys())
+        for prev, name in zip(names, names[1:]):
+            layer, bn = seq._modules[prev], seq._modules[name]
+            if isinstance(layer, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                seq._modules[prev] = fuse_conv_bn_eval(layer, bn)
+            elif isinstance(layer, nn.Linear) and isinstance(bn, nn.BatchNorm1d):
+                seq._modules[prev] = fuse_linear_bn_eval(layer, bn)
+            else:
+                continue
+            seq._modules[name] = nn.Identity()
+    return module
+
+
 # Upsale the spatial size by a factor of 2
 def upBlock(in_planes, out_planes):
     block = nn.Sequential(
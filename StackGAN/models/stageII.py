@@ -1,3 +1,5 @@
+import copy
+
 import torch
 import torch.nn as nn
 import torch.nn.parallel
@@ -6,6 +8,31 @@ from torch.autograd import Variable
 from stackgan import *
 
 ############## Networks for stageII GAN #############
+class FrozenStageI(object):
+    # inference-only copy of the frozen stageI generator, one per device:
+    # eval mode with BatchNorm folded, optionally autocast to bf16 on cpu
+    def __init__(self, stageI_G, bf16=False):
+        self.stageI_G = stageI_G
+        self.bf16 = bf16
+        self.models = {}
+
+    def get_model(self, device):
+        if device not in self.models:
+            model = copy.deepcopy(self.stageI_G).to(device).eval()
+            self.models[device] = fold_bn(model)
+        return self.models[device]
+
+    def __call__(self, text_embedding, noise):
+        model = self.get_model(text_embedding.device)
+        bf16 = self.bf16 and text_embedding.device.type == 'cpu'
+
+        with torch.inference_mode(), torch.autocast('cpu', dtype=torch.bfloat16, enabled=bf16):
+            _, stage1_img, _, _ = model(text_embedding, noise)
+
+        # back to a regular float32 tensor that stageII can save for backward
+        return stage1_img.float() if bf16 else stage1_img.clone()
+
+
 class _netG(nn.Module):
     def __init__(self, stageI_G, text_dim, nz, nef, ngf, r_num, cuda):
         super(_netG, self).__init__()
@@ -20,12 +47,17 @@ class _netG(nn.Module):
         self.r_num = r_num
 
         self._cuda = cuda
+        self.stage1_fast = None
 
         # fix parameters of stageI GAN
         for param in self.STAGE1_G.parameters():
             param.requires_grad = False
         self.define_module()
 
+    def freeze_stage1(self, bf16=False):
+        # run STAGE1_G through a folded inference copy instead of the module itself
+        self.stage1_fast = FrozenStageI(self.STAGE1_G, bf16)
+
     def _make_layer(self, block, channel_num, r_num):
         layers = []
         for i in range(r_num):
@@ -65,8 +97,11 @@ class _netG(nn.Module):
             nn.Tanh())
 
     def forward(self, text_embedding, noise):
-        _, stage1_img, _, _ = self.STAGE1_G(text_embedding, noise)
-        stage1_img = stage1_img.detach()
+        if self.stage1_fast is not None:
+            stage1_img = self.stage1_fast(text_embedding, noise)
+        else:
+            _, stage1_img, _, _ = self.STAGE1_G(text_embedding, noise)
+            stage1_img = stage1_img.detach()
         encoded_img = self.encoder(stage1_img)
 
         c_code, mu, logvar = self.ca_net(text_embedding)
@@ -0,0 +1,95 @@
+import io
+import os
+import json
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torchfile
+from PIL import Image
+
+
+def load_embeddings(datapath):
+    # parsing the .t7 file is slow: cache the embeddings next to it once, memory-map them afterwards
+    cache = os.path.splitext(datapath)[0] + '_embeddings.npy'
+    if not os.path.exists(cache):
+        t_file = torchfile.load(datapath)
+        embeddings = np.concatenate(t_file.fea_txt, axis=0).astype(np.float32)
+        with open(cache + '.tmp', 'wb') as f:
+            np.save(f, embeddings)
+        os.replace(cache + '.tmp', cache)
+        print('Successfully load sentences from: ', datapath)
+    return np.load(cache, mmap_mode='r')
+
+
+def write_shard(path, images, start, shard_format):
+    # images: N x H x W x 3 uint8, numbered from start; written to a temporary file first
+    tmp = path + '.tmp'
+    if shard_format == 'npz':
+        with open(tmp, 'wb') as f:
+            np.savez(f, images=images, index=np.arange(start, start + len(images)))
+    else:
+        with tarfile.open(tmp, 'w') as tar:
+            for i, im in enumerate(images):
+                buf = io.BytesIO()
+                Image.fromarray(im).save(buf, format='PNG')
+                info = tarfile.TarInfo('%09d.png' % (start + i))
+                info.size = buf.tell()
+                buf.seek(0)
+                tar.addfile(info, buf)
+    os.replace(tmp, path)
+
+
+class ShardWriter(object):
+    # encodes shards in a background pool and keeps a cursor of the completed ones,
+    # so an interrupted run restarts at the first shard that was not written
+    def __init__(self, save_dir, shard_size, shard_format='tar', workers=4):
+        if shard_format not in ('tar', 'npz'):
+            raise ValueError("shard_format should be 'tar' or 'npz', got %s" % shard_format)
+
+        self.save_dir = save_dir
+        self.shard_size = shard_size
+        self.shard_format = shard_format
+        self.cursor_path = os.path.join(save_dir, 'cursor.json')
+
+        self.cursor = 0
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path) as f:
+                state = json.load(f)
+            if state['shard_size'] != shard_size or state['shard_format'] != shard_format:
+                raise ValueError('%s was written with shard_size %d and shard_format %s'
+                                 % (self.cursor_path, state['shard_size'], state['shard_format']))
+            self.cursor = state['cursor']
+
+        self.pool = ThreadPoolExecutor(workers)
+        self.max_pending = 2 * workers
+        self.pending = deque()
+
+    def shard_path(self, shard):
+        return os.path.join(self.save_dir, 'shard_%06d.%s' % (shard, self.shard_format))
+
+    def save_cursor(self):
+        state = {'cursor': self.cursor, 'shard_size': self.shard_size, 'shard_format': self.shard_format}
+        with open(self.cursor_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.cursor_path + '.tmp', self.cursor_path)
+
+    def wait(self):
+        # shards are submitted in order, so the oldest one finishing moves the cursor past it
+        shard, future = self.pending.popleft()
+        future.result()
+        self.cursor = shard + 1
+        self.save_cursor()
+
+    def write(self, shard, images):
+        future = self.pool.submit(write_shard, self.shard_path(shard), images,
+                                  shard * self.shard_size, self.shard_format)
+        self.pending.append((shard, future))
+        while len(self.pending) > self.max_pending:
+            self.wait()
+
+    def close(self):
+        while self.pending:
+            self.wait()
+        self.pool.shutdown()
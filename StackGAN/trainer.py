@@ -1,6 +1,5 @@
 from __future__ import print_function
 from six.moves import range
-from PIL import Image
 
 import torch.backends.cudnn as cudnn
 import torch
@@ -11,12 +10,14 @@ import os
 import time
 
 import numpy as np
-import torchfile
 
 from utils import mkdir_p
 from utils import save_img_results, save_model
 from utils import KL_loss
 from utils import compute_discriminator_loss, compute_generator_loss
+from utils import parallelize, ParallelD
+from sampler import load_embeddings, ShardWriter
+from checkpoint import CheckpointWriter
 
 import models.stageI as stageI
 import models.stageII as stageII
@@ -68,6 +69,8 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.coeff_KL = config.coeff_KL
 
         if self.training:
@@ -130,6 +133,8 @@ class Trainer(object):
         if self.cuda:
             netG.cuda()
             netD.cuda()
+        if self.config.stageI_fast:
+            netG.freeze_stage1(self.config.stageI_bf16)
         return netG, netD
 
     def train(self):
@@ -137,6 +142,8 @@ class Trainer(object):
             netG, netD = self.load_network_stageI()
         else:
             netG, netD = self.load_network_stageII()
+        netG_parallel = parallelize(netG, range(self.ngpu))
+        netD_parallel = ParallelD(netD, range(self.ngpu))
 
         batch_size = self.batch_size
         noise = Variable(torch.FloatTensor(self.batch_size, self.nz))
@@ -185,25 +192,24 @@ class Trainer(object):
                 ######################################################
                 noise.data.normal_(0, 1)
                 inputs = (txt_embedding, noise)
-                _, fake_imgs, mu, logvar = \
-                    nn.parallel.data_parallel(netG, inputs, range(self.ngpu))
+                _, fake_imgs, mu, logvar = netG_parallel(*inputs)
 
                 ############################
                 # (3) Update D network
                 ###########################
                 netD.zero_grad()
                 errD, errD_real, errD_wrong, errD_fake = \
-                    compute_discriminator_loss(netD, real_imgs, fake_imgs,
+                    compute_discriminator_loss(netD_parallel, real_imgs, fake_imgs,
                                                real_labels, fake_labels,
-                                               mu, range(self.ngpu))
+                                               mu)
                 errD.backward()
                 optimizerD.step()
                 ############################
                 # (2) Update G network
                 ###########################
                 netG.zero_grad()
-                errG = compute_generator_loss(netD, fake_imgs,
-                                              real_labels, mu, range(self.ngpu))
+                errG = compute_generator_loss(netD_parallel, fake_imgs,
+                                              real_labels, mu)
                 kl_loss = KL_loss(mu, logvar)
                 errG_total = errG + kl_loss * self.coeff_KL
                 errG_total.backward()
@@ -213,8 +219,7 @@ class Trainer(object):
                 if i % 100 == 0:
                     # save the image result for each epoch
                     inputs = (txt_embedding, fixed_noise)
-                    lr_fake, fake, _, _ = \
-                        nn.parallel.data_parallel(netG, inputs, range(self.ngpu))
+                    lr_fake, fake, _, _ = netG_parallel(*inputs)
                     save_img_results(real_img_cpu, fake, epoch, self.image_dir, self.vis_count)
                     if lr_fake is not None:
                         save_img_results(None, lr_fake, epoch, self.image_dir, self.vis_count)
@@ -222,12 +227,13 @@ class Trainer(object):
                         Loss_real: %.4f Loss_wrong:%.4f Loss_fake %.4f
                         '''
                         % (epoch, self.niter, i, len(self.data_loader),
-                            errD.data[0], errG.data[0], kl_loss.data[0],
+                            errD.item(), errG.item(), kl_loss.item(),
                             errD_real, errD_wrong, errD_fake))
             if epoch % self.snapshot_interval == 0:
-                save_model(netG, netD, epoch, self.model_dir)
+                save_model(self.checkpoint, netG, netD, epoch, self.model_dir)
         #
-        save_model(netG, netD, self.niter, self.model_dir)
+        save_model(self.checkpoint, netG, netD, self.niter, self.model_dir)
+        self.checkpoint.close()
 
     def sample(self):
         if self.stage == 1:
@@ -235,53 +241,51 @@ class Trainer(object):
         else:
             netG, _ = self.load_network_stageII()
         netG.eval()
+        netG_parallel = parallelize(netG, range(self.ngpu))
 
-        # Load text embeddings generated from the encoder
-        t_file = torchfile.load(self.datapath)
-        captions_list = t_file.raw_txt
-        embeddings = np.concatenate(t_file.fea_txt, axis=0)
-        num_embeddings = len(captions_list)
-        print('Successfully load sentences from: ', self.datapath)
+        embeddings = load_embeddings(self.datapath)
+        num_embeddings = len(embeddings)
+        # embeddings are cycled when more samples than sentences are asked for
+        num_samples = self.config.num_samples or num_embeddings
         print('Total number of sentences:', num_embeddings)
         print('num_embeddings:', num_embeddings, embeddings.shape)
         # path to save generated samples
         save_dir = self.config.netG[:self.config.netG.find('.pth')]
         mkdir_p(save_dir)
 
-        batch_size = np.minimum(num_embeddings, self.batch_size)
-        noise = Variable(torch.FloatTensor(self.batch_size, self.nz))
-        if self.cuda:
-            noise = noise.cuda()
-        count = 0
-        while count < num_embeddings:
-            if count > 3000:
-                break
-            iend = count + self.batch_size
-            if iend > num_embeddings:
-                iend = num_embeddings
-                count = num_embeddings - batch_size
-            embeddings_batch = embeddings[count:iend]
-            # captions_batch = captions_list[count:iend]
-            txt_embedding = Variable(torch.FloatTensor(embeddings_batch))
-            if self.cuda:
-                txt_embedding = txt_embedding.cuda()
-
-            #######################################################
-            # (2) Generate fake images
-            ######################################################
-            noise.data.normal_(0, 1)
-            inputs = (txt_embedding, noise)
-            _, fake_imgs, mu, logvar = \
-                nn.parallel.data_parallel(netG, inputs, range(self.ngpu))
-            for i in range(self.batch_size):
-                save_name = '%s/%d.png' % (save_dir, count + i)
-                im = fake_imgs[i].data.cpu().numpy()
-                im = (im + 1.0) * 127.5
-                im = im.astype(np.uint8)
-                # print('im', im.shape)
-                im = np.transpose(im, (1, 2, 0))
-                # print('im', im.shape)
-                im = Image.fromarray(im)
-                im.save(save_name)
-            count += self.batch_size
+        shard_size = self.config.shard_size
+        num_shards = (num_samples + shard_size - 1) // shard_size
+        writer = ShardWriter(save_dir, shard_size, self.config.shard_format, self.config.sample_workers)
+        if writer.cursor > 0:
+            print('Resuming from shard %d / %d' % (writer.cursor, num_shards))
+
+        device = torch.device('cuda' if self.cuda else 'cpu')
+        txt_embedding = torch.empty(self.batch_size, self.text_dim, device=device)
+        noise = torch.empty(self.batch_size, self.nz, device=device)
+
+        with torch.inference_mode():
+            for shard in range(writer.cursor, num_shards):
+                start = shard * shard_size
+                end = min(start + shard_size, num_samples)
+                images = None
+
+                for count in range(start, end, self.batch_size):
+                    n = min(self.batch_size, end - count)
+                    index = np.arange(count, count + n) % num_embeddings
+                    txt_embedding[:n].copy_(torch.from_numpy(embeddings[index]))
+                    noise.normal_(0, 1)
+
+                    #######################################################
+                    # (2) Generate fake images
+                    ######################################################
+                    _, fake_imgs, _, _ = netG_parallel(txt_embedding[:n], noise[:n])
+                    fake_imgs = fake_imgs.add(1.0).mul(127.5).clamp_(0, 255).to(torch.uint8)
+                    fake_imgs = fake_imgs.permute(0, 2, 3, 1).cpu().numpy()
+                    if images is None:
+                        # sized from the generator output: 64px for Stage I, 256px for Stage II
+                        images = np.empty((end - start,) + fake_imgs.shape[1:], dtype=np.uint8)
+                    images[count - start:count - start + n] = fake_imgs
 
+                writer.write(shard, images)
+                print('[%d/%d] images: %d' % (shard + 1, num_shards, end))
+        writer.close()
@@ -18,36 +18,48 @@ def KL_loss(mu, logvar):
     return KLD
 
 
+def parallelize(module, gpus):
+    # one device or none: run the module directly
+    # several GPUs: a persistent nn.DataParallel, built once instead of on every call
+    gpus = list(gpus)
+    if module is None or len(gpus) <= 1:
+        return module
+    return nn.DataParallel(module, device_ids=gpus)
+
+
+class ParallelD(object):
+    # netD and its logit heads, each parallelized once
+    def __init__(self, netD, gpus):
+        self.encode_img = parallelize(netD, gpus)
+        self.get_cond_logits = parallelize(netD.get_cond_logits, gpus)
+        self.get_uncond_logits = parallelize(netD.get_uncond_logits, gpus)
+
+    def __call__(self, image):
+        return self.encode_img(image)
+
+
 def compute_discriminator_loss(netD, real_imgs, fake_imgs,
                                real_labels, fake_labels,
-                               conditions, gpus):
+                               conditions):
     criterion = nn.BCELoss()
     batch_size = real_imgs.size(0)
     cond = conditions.detach()
     fake = fake_imgs.detach()
-    real_features = nn.parallel.data_parallel(netD, (real_imgs), gpus)
-    fake_features = nn.parallel.data_parallel(netD, (fake), gpus)
+    real_features = netD(real_imgs)
+    fake_features = netD(fake)
     # real pairs
-    inputs = (real_features, cond)
-    real_logits = nn.parallel.data_parallel(netD.get_cond_logits, inputs, gpus)
+    real_logits = netD.get_cond_logits(real_features, cond)
     errD_real = criterion(real_logits, real_labels)
     # wrong pairs
-    inputs = (real_features[:(batch_size-1)], cond[1:])
-    wrong_logits = \
-        nn.parallel.data_parallel(netD.get_cond_logits, inputs, gpus)
+    wrong_logits = netD.get_cond_logits(real_features[:(batch_size-1)], cond[1:])
     errD_wrong = criterion(wrong_logits, fake_labels[1:])
     # fake pairs
-    inputs = (fake_features, cond)
-    fake_logits = nn.parallel.data_parallel(netD.get_cond_logits, inputs, gpus)
+    fake_logits = netD.get_cond_logits(fake_features, cond)
     errD_fake = criterion(fake_logits, fake_labels)
 
     if netD.get_uncond_logits is not None:
-        real_logits = \
-            nn.parallel.data_parallel(netD.get_uncond_logits,
-                                      (real_features), gpus)
-        fake_logits = \
-            nn.parallel.data_parallel(netD.get_uncond_logits,
-                                      (fake_features), gpus)
+        real_logits = netD.get_uncond_logits(real_features)
+        fake_logits = netD.get_uncond_logits(fake_features)
         uncond_errD_real = criterion(real_logits, real_labels)
         uncond_errD_fake = criterion(fake_logits, fake_labels)
         #
@@ -57,21 +69,18 @@ def compute_discriminator_loss(netD, real_imgs, fake_imgs,
         errD_fake = (errD_fake + uncond_errD_fake) / 2.
     else:
         errD = errD_real + (errD_fake + errD_wrong) * 0.5
-    return errD, errD_real.data[0], errD_wrong.data[0], errD_fake.data[0]
+    return errD, errD_real.item(), errD_wrong.item(), errD_fake.item()
 
 
-def compute_generator_loss(netD, fake_imgs, real_labels, conditions, gpus):
+def compute_generator_loss(netD, fake_imgs, real_labels, conditions):
     criterion = nn.BCELoss()
     cond = conditions.detach()
-    fake_features = nn.parallel.data_parallel(netD, (fake_imgs), gpus)
+    fake_features = netD(fake_imgs)
     # fake pairs
-    inputs = (fake_features, cond)
-    fake_logits = nn.parallel.data_parallel(netD.get_cond_logits, inputs, gpus)
+    fake_logits = netD.get_cond_logits(fake_features, cond)
     errD_fake = criterion(fake_logits, real_labels)
     if netD.get_uncond_logits is not None:
-        fake_logits = \
-            nn.parallel.data_parallel(netD.get_uncond_logits,
-                                      (fake_features), gpus)
+        fake_logits = netD.get_uncond_logits(fake_features)
         uncond_errD_fake = criterion(fake_logits, real_labels)
         errD_fake += uncond_errD_fake
     return errD_fake
@@ -96,13 +105,10 @@ def save_img_results(data_img, fake, epoch, image_dir, num):
             (image_dir, epoch), normalize=True)
 
 
-def save_model(netG, netD, epoch, model_dir):
-    torch.save(
-        netG.state_dict(),
-        '%s/netG_epoch_%d.pth' % (model_dir, epoch))
-    torch.save(
-        netD.state_dict(),
-        '%s/netD_epoch_last.pth' % (model_dir))
+def save_model(checkpoint, netG, netD, epoch, model_dir):
+    checkpoint.save({
+        '%s/netG_epoch_%d.pth' % (model_dir, epoch): netG.state_dict(),
+        '%s/netD_epoch_last.pth' % (model_dir): netD.state_dict()})
     print('Save G/D models')
 
 
@@ -0,0 +1,156 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+import time
+
+import torch
+from torch.utils.benchmark import Timer
+
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=8, help='input batch size')
+parser.add_argument('--image_size', type=int, default=128, help='the height / width of the input image to network')
+parser.add_argument('--na', type=int, default=5, help='number of attributes')
+parser.add_argument('--ngf', type=int, default=16)
+parser.add_argument('--ndf', type=int, default=16)
+parser.add_argument('--gp_intervals', type=int, nargs='+', default=[1, 4, 16], help='gradient penalty intervals to benchmark')
+parser.add_argument('--gp_batch_size', type=int, default=0, help='number of images in the gradient penalty pass, 0 for the whole batch')
+parser.add_argument('--steps', type=int, default=64, help='D steps per setting')
+parser.add_argument('--log_step', type=int, default=16, help='D steps between loss reports')
+parser.add_argument('--micro_batches', type=int, nargs='+', default=[1, 2, 4, 8], help='micro-batch counts to benchmark')
+parser.add_argument('--iters', type=int, default=3, help='timed iterations per micro-batch setting')
+parser.add_argument('--bench', nargs='+', default=['gp', 'micro'], help='benchmarks to run: gp, micro')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+class SavedTensor(object):
+    # a tensor saved for backward, counted as live until autograd frees it
+    def __init__(self, counter, tensor):
+        self.counter = counter
+        self.tensor = tensor
+        storage = tensor.untyped_storage()
+        self.ptr = storage.data_ptr()
+        counter.add(self.ptr, storage.nbytes())
+
+    def __del__(self):
+        self.counter.remove(self.ptr)
+
+
+class SavedTensorCounter(object):
+    def __init__(self):
+        self.storages = {}
+        self.live = 0
+        self.peak = 0
+
+    def add(self, ptr, nbytes):
+        if ptr not in self.storages:
+            self.storages[ptr] = [0, nbytes]
+            self.live += nbytes
+            self.peak = max(self.peak, self.live)
+        self.storages[ptr][0] += 1
+
+    def remove(self, ptr):
+        self.storages[ptr][0] -= 1
+        if self.storages[ptr][0] == 0:
+            self.live -= self.storages.pop(ptr)[1]
+
+
+def peak_memory(fn, cuda):
+    # cuda: peak allocated bytes; cpu: peak bytes of the tensors autograd keeps alive for backward
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    counter = SavedTensorCounter()
+    with torch.autograd.graph.saved_tensors_hooks(lambda tensor: SavedTensor(counter, tensor),
+                                                  lambda saved: saved.tensor):
+        fn()
+
+    return counter.peak
+
+
+def get_batch(config, device):
+    return (torch.randn(config.batch_size, 3, config.image_size, config.image_size, device=device),
+            torch.randint(2, (config.batch_size, config.na), device=device).float(),
+            torch.randint(2, (config.batch_size, config.na), device=device).float())
+
+
+def get_trainer(config, **kwargs):
+    args = ['--image_path', '', '--attribute_path', '',
+            '--batch_size', str(config.batch_size), '--image_size', str(config.image_size), '--na', str(config.na),
+            '--ngf', str(config.ngf), '--ndf', str(config.ndf)]
+    for key, value in kwargs.items():
+        args += ['--' + key, str(value)]
+    if config.cuda:
+        args.append('--cuda')
+    return Trainer(trainer_parser.parse_args(args), None)
+
+
+def bench_lazy_gp(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+
+    # the same fixed batches for every setting
+    torch.manual_seed(0)
+    batches = [get_batch(config, device) for _ in range(8)]
+
+    print("[*] StarGAN D step: lazy gradient penalty (gp_batch_size %s)" % (config.gp_batch_size or 'full'))
+    for gp_interval in config.gp_intervals:
+        torch.manual_seed(0)
+        trainer = get_trainer(config, gp_interval=gp_interval, gp_batch_size=config.gp_batch_size)
+
+        curve = []
+        step_time = 0
+        for step in range(config.steps):
+            real_x, real_label, fake_c = batches[step % len(batches)]
+            if config.cuda:
+                torch.cuda.synchronize()
+            start_time = time.time()
+            errD_real, errD_fake, errD_cls, errD_gp = trainer.update_D(real_x, real_label, fake_c, step)
+            if config.cuda:
+                torch.cuda.synchronize()
+            step_time += time.time() - start_time
+
+            if errD_gp is not None:
+                gp = errD_gp.item()
+            if (step + 1) % config.log_step == 0:
+                curve.append('%d: %.3f/%.3f' % (step + 1, (errD_real + errD_fake).item(), gp))
+
+        print('k: %2d - D step: %.2f ms, loss real+fake/gp: %s'
+              % (gp_interval, step_time / config.steps * 1e3, ', '.join(curve)))
+
+
+def bench_micro_batches(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+    real_x, real_label, fake_c = get_batch(config, device)
+
+    print("[*] StarGAN D + G step: batch %d split into micro-batches" % config.batch_size)
+    for micro_batches in config.micro_batches:
+        trainer = get_trainer(config, micro_batches=micro_batches)
+
+        def step():
+            trainer.update_D(real_x, real_label, fake_c, 0)
+            trainer.update_G(real_x, real_label, fake_c, fake_c)
+
+        step_time = Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        memory = peak_memory(step, config.cuda)
+
+        print('micro_batches: %2d - step: %.2f ms, peak memory: %.1f MB'
+              % (micro_batches, step_time * 1e3, memory / 2 ** 20))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+
+    if 'gp' in config.bench:
+        bench_lazy_gp(config)
+    if 'micro' in config.bench:
+        bench_micro_batches(config)
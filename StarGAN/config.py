@@ -9,11 +9,16 @@ parser.add_argument('--crop_size', type=int, default=178, help='the height / wid
 parser.add_argument('--image_size', type=int, default=128, help='the height / width of the input image to network')
 parser.add_argument('--mode', type=str, default='train', choices=['train', 'test'])
 parser.add_argument('--na', type=int, default=5, help='number of attributes')
+parser.add_argument('--n_exclusive', type=int, default=3, help='number of leading mutually exclusive attributes, ie hair colors')
+parser.add_argument('--max_combo', type=int, default=3, help='most attribute groups changed at once in the sample translations, 0 for no limit')
 parser.add_argument('--ngf', type=int, default=64)
 parser.add_argument('--ndf', type=int, default=64)
 parser.add_argument('--niter', type=int, default=20, help='number of epochs to train for')
 parser.add_argument('--niter_decay', type=int, default=10, help='number of epochs after which lr decays')
 parser.add_argument('--lr', type=float, default=0.0001, help='learning rate, default=0.0002')
+parser.add_argument('--gp_interval', type=int, default=1, help='compute the gradient penalty every k D steps, scaled by k')
+parser.add_argument('--gp_batch_size', type=int, default=0, help='number of images in the gradient penalty pass, 0 for the whole batch')
+parser.add_argument('--micro_batches', type=int, default=1, help='accumulate G and D gradients over this many chunks of each batch')
 parser.add_argument('--beta1', type=float, default=0.5, help='beta1 for adam. default=0.5')
 parser.add_argument('--cuda', action='store_true', help='enables cuda')
 parser.add_argument('--ngpu', type=int, default=1, help='number of GPUs to use')
@@ -22,6 +27,8 @@ parser.add_argument('--netD', default='', help="path to netD (to continue traini
 parser.add_argument('--outf', default=None, help='folder to output images and model checkpoints')
 parser.add_argument('--sample_step', type=int, default=2000, help='sample steps')
 parser.add_argument('--checkpoint_step', type=int, default=6000, help='checkpoint steps')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 def get_config():
     return parser.parse_args()
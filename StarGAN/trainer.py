@@ -1,11 +1,15 @@
+import itertools
+import time
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-import torchvision.utils as vutils
 from torch.autograd import Variable
 
 import models.stargan as stargan
+from utils import AsyncImageWriter
+from checkpoint import CheckpointWriter
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -21,8 +25,11 @@ class Trainer(object):
         self.data_loader = data_loader
         self.cuda = config.cuda
         self.ngpu = int(config.ngpu)
+        self.device = torch.device('cuda' if self.cuda else 'cpu')
 
         self.na = int(config.na)
+        self.n_exclusive = int(config.n_exclusive)
+        self.max_combo = int(config.max_combo)
         self.ngf = int(config.ngf)
         self.ndf = int(config.ndf)
         self.crop_size = config.crop_size
@@ -34,11 +41,18 @@ class Trainer(object):
         self.lr = config.lr
         self.beta1 = config.beta1
 
+        self.gp_interval = config.gp_interval
+        self.gp_batch_size = config.gp_batch_size
+        self.micro_batches = config.micro_batches
+
         self.outf = config.outf
+
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
         self.sample_step = config.sample_step
         self.checkpoint_step = config.checkpoint_step
 
         self.build_model()
+        self.build_celeb_targets()
 
     def build_model(self):
         self.netG = stargan._netG(self.ngpu, self.na, self.ngf)
@@ -64,35 +78,149 @@ class Trainer(object):
             x = x.cuda()
         return Variable(x, volatile=volatile)
 
-    def make_celeb_labels(self, real_c):
-        y = [torch.FloatTensor([1, 0, 0]),  # black hair
-             torch.FloatTensor([0, 1, 0]),  # blond hair
-             torch.FloatTensor([0, 0, 1])]  # brown hair
-
-        fixed_c_list = []
-
-        # single attribute transfer
-        for i in range(self.na):
-            fixed_c = real_c.clone()
-            for c in fixed_c:
-                if i < 3:
-                    c[:3] = y[i]
+    def build_celeb_targets(self):
+        # the first n_exclusive attributes are mutually exclusive (hair colors), the others are binary.
+        # single attribute transfer: each exclusive value, then each binary attribute flipped.
+        # multi-attribute transfer: every combination of two to max_combo groups, exclusive set to its last value
+        # (H+G, H+A, G+A, H+G+A for the default CelebA attributes). The combinations grow as 2^groups,
+        # so max_combo bounds them for configs with many attributes
+        exclusive = list(range(self.n_exclusive))
+        groups = ([exclusive] if exclusive else []) + [[i] for i in range(self.n_exclusive, self.na)]
+        max_combo = min(self.max_combo, len(groups)) if self.max_combo > 0 else len(groups)
+
+        targets = [(exclusive, [i], []) for i in exclusive]
+        targets += [([], [], [i]) for i in range(self.n_exclusive, self.na)]
+        for k in range(2, max_combo + 1):
+            for combo in itertools.combinations(groups, k):
+                if combo[0] is exclusive:
+                    targets.append((exclusive, exclusive[-1:], sum(combo[1:], [])))
                 else:
-                    c[i] = 0 if c[i] == 1 else 1  # opposite value
-            fixed_c_list.append(self.to_var(fixed_c, volatile=True))
-
-        # multi-attribute transfer (H+G, H+A, G+A, H+G+A)
-        for i in range(4):
-            fixed_c = real_c.clone()
-            for c in fixed_c:
-                if i in [0, 1, 3]:  # Hair color to brown
-                    c[:3] = y[2]
-                if i in [0, 2, 3]:  # Gender
-                    c[3] = 0 if c[3] == 1 else 1
-                if i in [1, 2, 3]:  # Aged
-                    c[4] = 0 if c[4] == 1 else 1
-            fixed_c_list.append(self.to_var(fixed_c, volatile=True))
-        return fixed_c_list
+                    targets.append(([], [], sum(combo, [])))
+
+        # (num_targets, 1, na) masks: attributes overwritten, their new value, attributes flipped
+        masks = torch.zeros(3, len(targets), 1, self.na)
+        for t, target in enumerate(targets):
+            for m, idx in enumerate(target):
+                masks[m, t, 0, idx] = 1
+        self.target_set, self.target_value, self.target_flip = masks.to(self.device)
+
+    def make_celeb_labels(self, real_c):
+        # (B, na) -> (num_targets, B, na)
+        c = real_c.to(self.device).unsqueeze(0)
+        c = c * (1 - self.target_set) + self.target_value
+        return (c - self.target_flip).abs()  # xor with the flipped attributes
+
+    def translate(self, x, target_c):
+        # one netG pass over x tiled across all target label sets (num_targets * B images).
+        # returns (B, 3, H, (num_targets + 1) * W): the input, then each translation along the width
+        num_targets, batch_size = target_c.size(0), x.size(0)
+        with torch.inference_mode():
+            x = x.to(self.device)
+            tiled = x.unsqueeze(0).expand(num_targets, *x.size()).reshape(-1, *x.size()[1:])
+            tiled = tiled.contiguous(memory_format=torch.channels_last)
+            fake_x = self.netG(tiled, target_c.reshape(-1, self.na))
+
+            images = torch.cat([x.unsqueeze(0), fake_x.view(num_targets, *x.size())], dim=0)
+            return images.permute(1, 2, 3, 0, 4).reshape(batch_size, x.size(1), x.size(2), -1)
+
+    def split(self, *tensors):
+        # micro-batches: gradients are accumulated over micro_batches chunks before each optimizer step
+        return zip(*[tensor.chunk(self.micro_batches) for tensor in tensors])
+
+    def update_D(self, real_x, real_label, fake_c, step):
+        batch_size = real_x.size(0)
+        errD_real, errD_fake, errD_cls = 0, 0, 0
+        fake_x = []
+
+        self.netD.zero_grad()
+        for x, label, c in self.split(real_x, real_label, fake_c):
+            weight = x.size(0) / float(batch_size)
+
+            # train with real
+            out_src, out_cls = self.netD(x)
+            real = - torch.mean(out_src)
+
+            cls = F.binary_cross_entropy_with_logits(
+                out_cls.view_as(label), label, size_average=False) / batch_size
+
+            # train with fake
+            with torch.no_grad():
+                fake = self.netG(x, c)
+            out_src, out_cls = self.netD(fake)
+            fake_x.append(fake)
+
+            # optimize
+            errD = (real + torch.mean(out_src)) * weight + 1 * cls
+            errD.backward()
+
+            errD_real += real.detach() * weight
+            errD_fake += torch.mean(out_src).detach() * weight
+            errD_cls += cls.detach()
+        self.optimizerD.step()
+
+        # lazy gradient penalty: every gp_interval steps on the first gp_batch_size images,
+        # scaled by gp_interval to keep its average weight
+        if step % self.gp_interval != 0:
+            return errD_real, errD_fake, errD_cls, None
+
+        gp_batch_size = self.gp_batch_size or batch_size
+        real_x, fake_x = real_x[:gp_batch_size], torch.cat(fake_x, dim=0)[:gp_batch_size]
+        errD_gp = 0
+
+        self.netD.zero_grad()
+        for x, fake in self.split(real_x, fake_x):
+            weight = x.size(0) / float(real_x.size(0))
+
+            alpha = torch.rand(x.size(0), 1, 1, 1, device=x.device).expand_as(x)
+            interpolated = Variable(alpha * x.data + (1 - alpha) * fake.data, requires_grad=True)
+            out, out_cls = self.netD(interpolated)
+
+            grad = torch.autograd.grad(outputs=out,
+                                       inputs=interpolated,
+                                       grad_outputs=torch.ones_like(out),
+                                       retain_graph=True,
+                                       create_graph=True,
+                                       only_inputs=True)[0]
+
+            grad = grad.view(grad.size(0), -1)
+            grad_l2norm = torch.sqrt(torch.sum(grad ** 2, dim=1))
+            gp = torch.mean((grad_l2norm - 1) ** 2)
+
+            # optimize
+            errD = 10 * self.gp_interval * gp * weight
+            errD.backward()
+
+            errD_gp += gp.detach() * weight
+        self.optimizerD.step()
+
+        return errD_real, errD_fake, errD_cls, errD_gp
+
+    def update_G(self, real_x, real_c, fake_c, fake_label):
+        batch_size = real_x.size(0)
+        errG_fake, errG_rec, errG_cls = 0, 0, 0
+
+        self.netG.zero_grad()
+        for x, rc, fc, label in self.split(real_x, real_c, fake_c, fake_label):
+            weight = x.size(0) / float(batch_size)
+
+            fake_x = self.netG(x, fc)
+            rec_x = self.netG(fake_x, rc)
+
+            out_src, out_cls = self.netD(fake_x)
+            fake = - torch.mean(out_src)
+            rec = torch.mean(torch.abs(x - rec_x))
+            cls = F.binary_cross_entropy_with_logits(
+                out_cls.view_as(label), label, size_average=False) / batch_size
+
+            errG = (fake + 10 * rec) * weight + 1 * cls
+            errG.backward()
+
+            errG_fake += fake.detach() * weight
+            errG_rec += rec.detach() * weight
+            errG_cls += cls.detach()
+        self.optimizerG.step()
+
+        return errG_fake, errG_rec, errG_cls
 
     def train(self):
         # fixed images for samples
@@ -105,10 +233,10 @@ class Trainer(object):
                 break
 
         fixed_x = torch.cat(fixed_x, dim=0)
-        fixed_x = self.to_var(fixed_x, volatile=True)
         real_c = torch.cat(real_c, dim=0)
 
-        fixed_c_list = self.make_celeb_labels(real_c)
+        fixed_c = self.make_celeb_labels(real_c)
+        image_writer = AsyncImageWriter()
 
         for epoch in range(self.niter):
             for i, (real_x, real_label) in enumerate(self.data_loader):
@@ -130,46 +258,9 @@ class Trainer(object):
                 for p in self.netD.parameters(): # reset requires_grad
                     p.requires_grad = True # they are set to False below in netG update
 
-                # train with real
-                out_src, out_cls = self.netD(real_x)
-                errD_real = - torch.mean(out_src)
-
-                errD_cls = F.binary_cross_entropy_with_logits(
-                    out_cls, real_label, size_average=False) / real_x.size(0)
-
-                # train with fake
-                fake_x = self.netG(real_x, fake_c)
-                fake_x = Variable(fake_x.data)
-                out_src, out_cls = self.netD(fake_x)
-                errD_fake = torch.mean(out_src)
-
-                # optimize
-                errD = errD_real + errD_fake + 1 * errD_cls
-                self.netD.zero_grad()
-                errD.backward()
-                self.optimizerD.step()
-
-                # gradient penalty
-                alpha = torch.rand(real_x.size(0), 1, 1, 1).cuda().expand_as(real_x)
-                interpolated = Variable(alpha * real_x.data + (1 - alpha) * fake_x.data, requires_grad=True)
-                out, out_cls = self.netD(interpolated)
-
-                grad = torch.autograd.grad(outputs=out,
-                                           inputs=interpolated,
-                                           grad_outputs=torch.ones(out.size()).cuda(),
-                                           retain_graph=True,
-                                           create_graph=True,
-                                           only_inputs=True)[0]
-
-                grad = grad.view(grad.size(0), -1)
-                grad_l2norm = torch.sqrt(torch.sum(grad ** 2, dim=1))
-                errD_gp = torch.mean((grad_l2norm - 1) ** 2)
-
-                # optimize
-                errD = 10 * errD_gp
-                self.netD.zero_grad()
-                errD.backward()
-                self.optimizerD.step()
+                errD_real, errD_fake, errD_cls, gp = self.update_D(real_x, real_label, fake_c, i)
+                if gp is not None:
+                    errD_gp = gp
 
                 ############################
                 # (2) Update G network: maximize log(D(G(z)))
@@ -178,39 +269,25 @@ class Trainer(object):
                     p.requires_grad = False # to avoid computation
 
                 if (i + 1) % 5 == 0:
-                    fake_x = self.netG(real_x, fake_c)
-                    rec_x = self.netG(fake_x, real_c)
-
-                    out_src, out_cls = self.netD(fake_x)
-                    errG_fake = - torch.mean(out_src)
-                    errG_rec = torch.mean(torch.abs(real_x - rec_x))
-                    errG_cls = F.binary_cross_entropy_with_logits(
-                        out_cls, fake_label, size_average=False) / fake_x.size(0)
-
-                    errG = errG_fake + 10 * errG_rec + 1 * errG_cls
-                    self.netG.zero_grad()
-                    errG.backward()
-                    self.optimizerG.step()
+                    errG_fake, errG_rec, errG_cls = self.update_G(real_x, real_c, fake_c, fake_label)
 
                     print('[%d/%d][%d/%d] Loss_D_real/fake: %.4f Loss_D_cls: %.4f Loss_D_gp: %.4f'
                           'Loss_G_fake: %.4f Loss_G_rec: %.4f Loss_G_cls: %.4f'
                           % (epoch + 1, self.niter, i + 1, len(self.data_loader),
-                             errD_real.data[0]+errD_fake.data[0], errD_cls.data[0], errD_gp.data[0],
-                             errG_fake.data[0], errG_rec.data[0], errG_cls.data[0]))
+                             (errD_real + errD_fake).item(), errD_cls.item(), errD_gp.item(),
+                             errG_fake.item(), errG_rec.item(), errG_cls.item()))
 
                 if (i + 1) % self.sample_step == 0:
-                    fake_image_list = [fixed_x]
-                    for fixed_c in fixed_c_list:
-                        fake_image_list.append(self.netG(fixed_x, fixed_c))
-                    fake_images = torch.cat(fake_image_list, dim=3)
-                    vutils.save_image(fake_images.data,
+                    fake_images = self.translate(fixed_x, fixed_c)
+                    image_writer.save(fake_images,
                                       '%s/fake_samples_epoch_%03d_step_%03d.png'
                                       % (self.outf, epoch + 1, i + 1),
                                       normalize=True, nrow=1, padding=0)
 
                 if (i + 1) % self.checkpoint_step == 0:
-                    torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d_step_%03d.pth' % (self.outf, epoch + 1, i + 1))
-                    torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d_step_%03d.pth' % (self.outf, epoch + 1, i + 1))
+                    self.checkpoint.save({
+                        '%s/netG_epoch_%03d_step_%03d.pth' % (self.outf, epoch + 1, i + 1): self.netG.state_dict(),
+                        '%s/netD_epoch_%03d_step_%03d.pth' % (self.outf, epoch + 1, i + 1): self.netD.state_dict()})
 
             if (epoch + 1) > (self.niter - self.niter_decay):
                 self.lr -= (self.lr / float(self.niter_decay))
@@ -218,21 +295,26 @@ class Trainer(object):
                     param_group['lr'] = self.lr
                 for param_group in self.optimizerD.param_groups:
                     param_group['lr'] = self.lr
+        image_writer.close()
+        self.checkpoint.close()
 
     def test(self):
         self.netG.load_state_dict(torch.load(self.config.netG))
         self.netG.eval()
+        self.netG.to(memory_format=torch.channels_last)
 
+        image_writer = AsyncImageWriter()
+        num_images = 0
+        start_time = time.time()
         for i, (real_x, org_c) in enumerate(self.data_loader):
-            real_x = self.to_var(real_x, volatile=True)
-
-            target_c_list = self.make_celeb_labels(org_c)
-
-            fake_image_list = [real_x]
-            for target_c in target_c_list:
-                fake_image_list.append(self.netG(real_x, target_c))
-            fake_images = torch.cat(fake_image_list, dim=3)
-            vutils.save_image(fake_images.data,
+            target_c = self.make_celeb_labels(org_c)
+            fake_images = self.translate(real_x, target_c)
+            image_writer.save(fake_images,
                               '%s/test_images_%d.png'
                               % (self.outf, i + 1),
-                              normalize=True, nrow=1, padding=0)
\ No newline at end of file
+                              normalize=True, nrow=1, padding=0)
+            num_images += target_c.size(0) * target_c.size(1)
+        image_writer.close()
+
+        elapsed = time.time() - start_time
+        print('%d images translated in %.1fs: %.1f images/sec' % (num_images, elapsed, num_images / elapsed))
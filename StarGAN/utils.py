@@ -0,0 +1,23 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torchvision.utils as vutils
+
+
+class AsyncImageWriter(object):
+    # runs vutils.save_image on background threads so netG does not wait on png encoding
+    def __init__(self, workers=1, max_pending=4):
+        self.pool = ThreadPoolExecutor(workers)
+        self.max_pending = max_pending
+        self.pending = deque()
+
+    def save(self, images, filename, **kwargs):
+        images = images.detach().cpu()
+        self.pending.append(self.pool.submit(vutils.save_image, images, filename, **kwargs))
+        while len(self.pending) > self.max_pending:
+            self.pending.popleft().result()
+
+    def close(self):
+        while self.pending:
+            self.pending.popleft().result()
+        self.pool.shutdown()
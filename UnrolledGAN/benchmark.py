@@ -0,0 +1,108 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+import tempfile
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.benchmark import Timer
+
+from config import parser as trainer_parser
+from trainer import Trainer, EnsembleTrainer, weights_init
+from utils import circles
+import models.dcgan as dcgan
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=512, help='input batch size')
+parser.add_argument('--ensembles', type=int, nargs='+', default=[1, 8, 32, 100], help='ensemble sizes to benchmark')
+parser.add_argument('--eval_samples', type=int, default=100000, help='generated samples per mode coverage evaluation')
+parser.add_argument('--iters', type=int, default=20, help='timed iterations per setting')
+parser.add_argument('--bench', nargs='+', default=['ensemble', 'coverage'], help='benchmarks to run: ensemble, coverage')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def get_config(config, ensemble):
+    args = ['--batch_size', str(config.batch_size), '--ensemble', str(ensemble),
+            '--eval_samples', str(config.eval_samples), '--outf', tempfile.mkdtemp()]
+    if config.cuda:
+        args.append('--cuda')
+    trainer_config = trainer_parser.parse_args(args)
+    trainer_config.manual_seed = 0
+    return trainer_config
+
+
+def bench_single(config):
+    # reference: the Trainer's D and G updates for one seed
+    device = torch.device('cuda' if config.cuda else 'cpu')
+    trainer_config = get_config(config, 1)
+    netG = dcgan._netG(1, trainer_config.nz, trainer_config.ngf, trainer_config.nc).to(device)
+    netG.apply(weights_init)
+    netD = dcgan._netD(1, trainer_config.nc, trainer_config.ndf).to(device)
+    netD.apply(weights_init)
+    criterion = nn.BCELoss()
+    optimizerD = optim.Adam(netD.parameters(), lr=trainer_config.lrD, betas=(trainer_config.beta1, 0.999))
+    optimizerG = optim.Adam(netG.parameters(), lr=trainer_config.lrG, betas=(trainer_config.beta1, 0.999))
+    ones = torch.ones(config.batch_size, device=device)
+    zeros = torch.zeros(config.batch_size, device=device)
+
+    def step():
+        data, _ = circles(1, config.batch_size, device)
+        noise = torch.randn(config.batch_size, trainer_config.nz, device=device)
+
+        netD.zero_grad()
+        criterion(netD(data[0]), ones).backward()
+        fake = netG(noise)
+        criterion(netD(fake.detach()), zeros).backward()
+        optimizerD.step()
+
+        netG.zero_grad()
+        (-criterion(netD(fake), zeros)).backward()
+        optimizerG.step()
+
+    return Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+
+
+def bench_ensemble(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+
+    print("[*] UnrolledGAN train step: one seed at a time vs vmapped ensembles, batch %d" % config.batch_size)
+    single_time = bench_single(config)
+    print('%-12s - step: %.2f ms, %.1f seed-steps/s' % ('single', single_time * 1e3, 1 / single_time))
+
+    for ensemble in config.ensembles:
+        trainer = EnsembleTrainer(get_config(config, ensemble))
+
+        def step():
+            data, _ = circles(ensemble, config.batch_size, device)
+            noise = torch.randn(ensemble, config.batch_size, trainer.nz, device=device)
+            trainer.train_step(data, noise)
+
+        step_time = Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        print('ensemble %3d - step: %.2f ms, %.1f seed-steps/s (%.1fx the single seed throughput)'
+              % (ensemble, step_time * 1e3, ensemble / step_time, single_time * ensemble / step_time))
+
+
+def bench_coverage(config):
+    print("[*] UnrolledGAN mode coverage evaluation: %d samples per seed" % config.eval_samples)
+    trainer = Trainer(get_config(config, 0))
+    eval_time = Timer('trainer.evaluate(0)', globals=locals(), num_threads=torch.get_num_threads()).timeit(3).mean
+    print('%-12s - evaluate: %.2f ms' % ('single', eval_time * 1e3))
+
+    for ensemble in config.ensembles:
+        trainer = EnsembleTrainer(get_config(config, ensemble))
+        eval_time = Timer('trainer.evaluate(0)', globals=locals(), num_threads=torch.get_num_threads()).timeit(3).mean
+        print('ensemble %3d - evaluate: %.2f ms, %.2f ms per seed'
+              % (ensemble, eval_time * 1e3, eval_time * 1e3 / ensemble))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+
+    if 'ensemble' in config.bench:
+        bench_ensemble(config)
+    if 'coverage' in config.bench:
+        bench_coverage(config)
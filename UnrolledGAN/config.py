@@ -17,6 +17,11 @@ parser.add_argument('--netG', default='', help="path to netG (to continue traini
 parser.add_argument('--netD', default='', help="path to netD (to continue training)")
 parser.add_argument('--outf', default=None, help='folder to output images and model checkpoints')
 parser.add_argument('--unrolling_steps', default=5, help='unrolling steps. default=5')
+parser.add_argument('--ensemble', type=int, default=0, help='number of G/D pairs trained together, each from its own seed. default=0 (single model)')
+parser.add_argument('--eval_step', type=int, default=500, help='iterations between mode coverage evaluations, 0 to disable. default=500')
+parser.add_argument('--eval_samples', type=int, default=100000, help='generated samples per mode coverage evaluation. default=100000')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 
 def get_config():
@@ -6,7 +6,7 @@ import os
 
 from data_loader import get_loader
 from config import get_config
-from trainer import Trainer
+from trainer import Trainer, EnsembleTrainer
 
 def main(config):
     if config.outf is None:
@@ -26,7 +26,10 @@ def main(config):
     if torch.cuda.is_available() and not config.cuda:
         print("WARNING: You have a CUDA device, so you should probably run with --cuda")
 
-    trainer = Trainer(config)
+    if config.ensemble > 0:
+        trainer = EnsembleTrainer(config)
+    else:
+        trainer = Trainer(config)
     trainer.train()
 
 if __name__ == "__main__":
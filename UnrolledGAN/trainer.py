@@ -1,5 +1,8 @@
+import copy
+
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 import torchvision.utils as vutils
 from torch.autograd import Variable
@@ -9,7 +12,13 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 import models.dcgan as dcgan
-from utils import circle
+from checkpoint import CheckpointWriter
+from utils import circle, circles, circle_centers, mode_coverage, write_metrics
+
+EVAL_CHUNK = 16384
+
+def chunks(total, size):
+    return [min(size, total - start) for start in range(0, total, size)]
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -26,6 +35,7 @@ class Trainer(object):
         self.ngf = int(config.ngf)
         self.ndf = int(config.ndf)
         self.cuda = config.cuda
+        self.device = torch.device('cuda' if self.cuda else 'cpu')
 
         self.batch_size = config.batch_size
 
@@ -39,6 +49,9 @@ class Trainer(object):
 
         self.unrolling_steps = config.unrolling_steps
 
+        self.eval_step = config.eval_step
+        self.eval_samples = config.eval_samples
+
         self.build_model()
 
         if self.cuda:
@@ -51,6 +64,15 @@ class Trainer(object):
         self.netD = dcgan._netD(self.ngpu, self.nc, self.ndf)
         self.netD.apply(weights_init)
         
+    def evaluate(self, epoch):
+        # mode coverage of a large sample, generated in chunks
+        with torch.inference_mode():
+            samples = torch.cat([self.netG(torch.randn(n, self.nz, device=self.device))
+                                 for n in chunks(self.eval_samples, EVAL_CHUNK)])
+        metrics = mode_coverage(samples, circle_centers(self.device))
+        write_metrics('%s/metrics.csv' % self.outf, epoch, [self.config.manual_seed], metrics)
+        return metrics
+
     def train(self):
         criterion = nn.BCELoss()
 
@@ -125,13 +147,170 @@ class Trainer(object):
 
             print('[%d/%d] Loss_D: %.4f Loss_G: %.4f D(x): %.4f D(G(z)): %.4f / %.4f'
                   % (epoch, self.niter,
-                     errD.data[0], errG.data[0], D_x, D_G_z1, D_G_z2))
+                     errD.item(), errG.item(), D_x, D_G_z1, D_G_z2))
             if epoch % 1000 == 0:
+                data = data.cpu()
                 plt.scatter(data[:,0], data[:,1], s=10)
                 plt.savefig(
                         '%s/real_samples.png' % self.outf)
-                fake = self.netG(fixed_noise)
+                with torch.no_grad():
+                    fake = self.netG(fixed_noise).cpu()
                 plt.scatter(fake[:,0], fake[:,1], s=10)
                 plt.savefig(
                         '%s/fake_samples_epoch_%03d.png' % (self.outf, epoch))
                 plt.close()
+            if self.eval_step > 0 and epoch % self.eval_step == 0:
+                metrics = self.evaluate(epoch)
+                print('[%d/%d] modes: %d high quality: %.4f KL: %.4f'
+                      % (epoch, self.niter, metrics['modes'], metrics['high_quality'], metrics['kl']))
+
+
+class EnsembleTrainer(object):
+    # trains config.ensemble independent G/D pairs at once: the parameters of the pairs are
+    # stacked along a leading member dimension and the forward passes are vmapped over it
+    def __init__(self, config):
+        self.config = config
+
+        self.ngpu = int(config.ngpu)
+        self.nc = int(config.nc)
+        self.nz = int(config.nz)
+        self.ngf = int(config.ngf)
+        self.ndf = int(config.ndf)
+        self.cuda = config.cuda
+        self.device = torch.device('cuda' if self.cuda else 'cpu')
+
+        self.batch_size = config.batch_size
+
+        self.lrG = config.lrG
+        self.lrD = config.lrD
+        self.beta1 = config.beta1
+
+        self.niter = config.niter
+
+        self.outf = config.outf
+
+        self.eval_step = config.eval_step
+        self.eval_samples = config.eval_samples
+
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
+        self.ensemble = config.ensemble
+        self.seeds = [config.manual_seed + i for i in range(self.ensemble)]
+
+        self.build_model()
+
+    def build_model(self):
+        netGs, netDs = [], []
+        for seed in self.seeds:
+            # every member is initialized exactly as a single run with its seed would be
+            torch.manual_seed(seed)
+            netG = dcgan._netG(self.ngpu, self.nz, self.ngf, self.nc)
+            netG.apply(weights_init)
+            netD = dcgan._netD(self.ngpu, self.nc, self.ndf)
+            netD.apply(weights_init)
+            netGs.append(netG.to(self.device))
+            netDs.append(netD.to(self.device))
+
+        # the Sequential bodies are called directly: the modules' forward checks input.data, which vmap forbids
+        self.paramsG, _ = torch.func.stack_module_state([netG.main for netG in netGs])
+        self.paramsD, _ = torch.func.stack_module_state([netD.main for netD in netDs])
+        self.netG = copy.deepcopy(netGs[0].main).to('meta')
+        self.netD = copy.deepcopy(netDs[0].main).to('meta')
+
+        self.G = torch.func.vmap(lambda params, input: torch.func.functional_call(self.netG, params, (input,)))
+        self.D = torch.func.vmap(lambda params, input: torch.func.functional_call(self.netD, params, (input,)).squeeze(1))
+
+        # Adam is elementwise, so one optimizer over the stacked parameters keeps separate moments per member
+        self.optimizerD = optim.Adam(self.paramsD.values(), lr=self.lrD, betas=(self.beta1, 0.999))
+        self.optimizerG = optim.Adam(self.paramsG.values(), lr=self.lrG, betas=(self.beta1, 0.999))
+
+    def train_step(self, data, noise):
+        # data: ensemble x batch_size x nc, noise: ensemble x batch_size x nz; returns per-member losses and D outputs
+        ones = torch.ones(data.shape[:2], device=self.device)
+        zeros = torch.zeros(data.shape[:2], device=self.device)
+
+        ############################
+        # (1) Update D network: maximize log(D(x)) + log(1 - D(G(z)))
+        ###########################
+        # the members' losses are independent, so the gradient of their sum is each member's own gradient
+        self.optimizerD.zero_grad()
+
+        output = self.D(self.paramsD, data)
+        errD_real = F.binary_cross_entropy(output, ones, reduction='none').mean(1)
+        D_x = output.detach().mean(1)
+
+        fake = self.G(self.paramsG, noise)
+        output = self.D(self.paramsD, fake.detach())
+        errD_fake = F.binary_cross_entropy(output, zeros, reduction='none').mean(1)
+        D_G_z1 = output.detach().mean(1)
+
+        errD = errD_real + errD_fake
+        errD.sum().backward()
+        self.optimizerD.step()
+
+        ############################
+        # (2) Update G network: minimize log(1 - D(G(z)))
+        ###########################
+        # D's parameters are detached: the G update needs no D gradients
+        self.optimizerG.zero_grad()
+
+        output = self.D({name: param.detach() for name, param in self.paramsD.items()}, fake)
+        errG = -F.binary_cross_entropy(output, zeros, reduction='none').mean(1)
+        D_G_z2 = output.detach().mean(1)
+
+        errG.sum().backward()
+        self.optimizerG.step()
+
+        return errD.detach(), errG.detach(), D_x, D_G_z1, D_G_z2
+
+    def evaluate(self, epoch):
+        # mode coverage of a large sample per member, generated in chunks of about EVAL_CHUNK points
+        with torch.inference_mode():
+            samples = torch.cat([self.G(self.paramsG, torch.randn(self.ensemble, n, self.nz, device=self.device))
+                                 for n in chunks(self.eval_samples, max(1, EVAL_CHUNK // self.ensemble))], 1)
+        metrics = mode_coverage(samples, circle_centers(self.device))
+        write_metrics('%s/metrics.csv' % self.outf, epoch, self.seeds, metrics)
+        return metrics
+
+    def save_samples(self, fixed_noise, epoch):
+        # scatter plots of up to 16 members
+        with torch.no_grad():
+            fake = self.G(self.paramsG, fixed_noise).cpu()
+        n = min(self.ensemble, 16)
+        cols = min(n, 4)
+        rows = (n + cols - 1) // cols
+        fig, axes = plt.subplots(rows, cols, figsize=(3 * cols, 3 * rows), squeeze=False)
+        for i, ax in enumerate(axes.flat):
+            if i < n:
+                ax.scatter(fake[i, :, 0], fake[i, :, 1], s=2)
+                ax.set_title('seed %d' % self.seeds[i], fontsize=8)
+            ax.axis('off')
+        fig.savefig('%s/fake_samples_epoch_%03d.png' % (self.outf, epoch))
+        plt.close(fig)
+
+    def train(self):
+        fixed_noise = torch.randn(self.ensemble, self.batch_size, self.nz, device=self.device)
+
+        for epoch in range(self.niter):
+            data, _ = circles(self.ensemble, self.batch_size, self.device)
+            noise = torch.randn(self.ensemble, self.batch_size, self.nz, device=self.device)
+
+            errD, errG, D_x, D_G_z1, D_G_z2 = self.train_step(data, noise)
+
+            if epoch % 100 == 0:
+                print('[%d/%d] ensemble of %d, mean (min/max) Loss_D: %.4f (%.4f/%.4f) Loss_G: %.4f (%.4f/%.4f) '
+                      'D(x): %.4f D(G(z)): %.4f / %.4f'
+                      % (epoch, self.niter, self.ensemble,
+                         errD.mean(), errD.min(), errD.max(), errG.mean(), errG.min(), errG.max(),
+                         D_x.mean(), D_G_z1.mean(), D_G_z2.mean()))
+            if epoch % 1000 == 0:
+                self.save_samples(fixed_noise, epoch)
+            if self.eval_step > 0 and epoch % self.eval_step == 0:
+                metrics = self.evaluate(epoch)
+                print('[%d/%d] mean (min/max) modes: %.2f (%d/%d) high quality: %.4f KL: %.4f'
+                      % (epoch, self.niter, metrics['modes'].float().mean(), metrics['modes'].min(),
+                         metrics['modes'].max(), metrics['high_quality'].mean(), metrics['kl'].mean()))
+
+        self.checkpoint.save({'%s/ensemble.pth' % self.outf: {'seeds': self.seeds,
+                                                              'netG': self.paramsG, 'netD': self.paramsD}})
+        self.checkpoint.close()
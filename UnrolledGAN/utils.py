@@ -1,3 +1,4 @@
+import os
 import torch
 import numpy as np
 import math
@@ -71,3 +72,59 @@ def circle(num_data=1000):
     return d, label
 
 
+def circles(n, num_data=1000, device='cpu'):
+    # n independent draws of circle(num_data) at once: n x num_data x 2 points, labels the mixture component
+    if num_data % 8 != 0:
+        raise ValueError('num_data should be multiple of 8. num_data = {}'.format(num_data))
+
+    sigma = 0.02
+
+    label = torch.arange(8).repeat_interleave(num_data // 8).to(device)
+    d = circle_centers(device)[label] + sigma * torch.randn(n, num_data, 2, device=device)
+
+    return d, label
+
+
+def circle_centers(device='cpu'):
+    # the 8 mixture components of circle(), in label order
+    center1 = 2
+    center2 = np.sqrt(2)
+
+    return torch.tensor([[0, center1], [center2, center2], [center1, 0], [center2, -center2],
+                         [0, -center1], [-center2, -center2], [-center1, 0], [-center2, center2]],
+                        dtype=torch.float, device=device)
+
+
+def mode_coverage(samples, centers, sigma=0.02, std_threshold=3, min_count=None):
+    # samples: ... x N x 2, any leading dimensions are independent sample sets (e.g. ensemble members).
+    # a sample is high quality within std_threshold standard deviations of its nearest center; a mode is
+    # covered with at least min_count high quality samples, by default the 20 in 2500 used by VEEGAN
+    num_samples = samples.size(-2)
+    num_modes = centers.size(0)
+    if min_count is None:
+        min_count = 20 * num_samples / 2500.
+
+    distance, mode = torch.cdist(samples, centers).min(-1)
+    high_quality = distance < std_threshold * sigma
+
+    counts = torch.zeros(samples.shape[:-2] + (num_modes,), device=samples.device)
+    counts.scatter_add_(-1, mode, high_quality.float())
+
+    # KL(p || uniform) of the high quality samples over the modes, nan if there are none
+    p = counts / counts.sum(-1, keepdim=True)
+    kl = torch.xlogy(p, p * num_modes).sum(-1)
+
+    return {'modes': (counts >= min_count).sum(-1),
+            'high_quality': high_quality.float().mean(-1),
+            'kl': kl}
+
+
+def write_metrics(path, epoch, seeds, metrics):
+    # appends one csv row per seed; metrics holds one value per seed
+    new_file = not os.path.exists(path)
+    with open(path, 'a') as f:
+        if new_file:
+            f.write('epoch,seed,%s\n' % ','.join(metrics))
+        values = [metric.reshape(-1).tolist() for metric in metrics.values()]
+        for i, seed in enumerate(seeds):
+            f.write('%d,%d,%s\n' % (epoch, seed, ','.join('%g' % value[i] for value in values)))
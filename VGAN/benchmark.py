@@ -0,0 +1,71 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+
+import torch
+from torch.utils.benchmark import Timer
+
+from models import vgan as vgan
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=8, help='number of videos generated per iteration')
+parser.add_argument('--image_size', type=int, default=64, help='resize all frames to this size')
+parser.add_argument('--n_channels', type=int, default=3, help='number of channels in the input data')
+parser.add_argument('--video_length', type=int, default=10, help='length of the video')
+parser.add_argument('--ngfs', type=int, nargs='+', default=[128, 96, 64], help='generator widths to benchmark')
+parser.add_argument('--iters', type=int, default=5, help='timed iterations per setting')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def peak_memory(fn, cuda):
+    # cuda: peak allocated bytes; cpu: bytes of the tensors autograd keeps alive for backward
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn()
+
+    return sum(storages.values())
+
+
+def bench_generator(config):
+    images = torch.randn(config.batch_size, config.n_channels, config.image_size, config.image_size)
+    if config.cuda:
+        images = images.cuda()
+
+    print("[*] VideoGenerator forward + backward, batch %d" % config.batch_size)
+    for ngf in config.ngfs:
+        for checkpoint_video in (False, True):
+            generator = vgan.VideoGenerator(config.n_channels, config.video_length, ngf=ngf,
+                                            checkpoint_video=checkpoint_video)
+            if config.cuda:
+                generator.cuda()
+
+            def step():
+                generator(images).mean().backward()
+
+            step_time = Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+            memory = peak_memory(step, config.cuda)
+
+            print('ngf: %3d, checkpoint: %-5s - time: %.2f ms, %.1f videos/s, peak memory: %.1f MB'
+                  % (ngf, checkpoint_video, step_time * 1e3, config.batch_size / step_time, memory / 2 ** 20))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    bench_generator(config)
@@ -1,7 +1,10 @@
+from contextlib import contextmanager, nullcontext
+
 import torch
 import torch.nn as nn
 import torch.nn.parallel
 import torch.utils.data
+from torch.utils.checkpoint import checkpoint
 from torch.autograd import Variable
 
 import numpy as np
@@ -12,6 +15,22 @@ else:
     T = torch
 
 
+@contextmanager
+def frozen_bn_stats(net):
+    # for the recomputation of a checkpointed segment: batch norm normalizes with the batch statistics
+    # again, but its running statistics and batch count were already updated by the first forward
+    bns = [m for m in net.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    state = [(m.momentum, m.num_batches_tracked.clone()) for m in bns]
+    for m in bns:
+        m.momentum = 0.0
+    try:
+        yield
+    finally:
+        for m, (momentum, num_batches_tracked) in zip(bns, state):
+            m.momentum = momentum
+            m.num_batches_tracked.copy_(num_batches_tracked)
+
+
 class VideoDiscriminator(nn.Module):
     def __init__(self, n_channels, n_output_neurons=1):
         super(VideoDiscriminator, self).__init__()
@@ -49,87 +68,107 @@ class VideoDiscriminator(nn.Module):
 
 
 class VideoGenerator(nn.Module):
-    def __init__(self, n_channels, video_length):
+    def __init__(self, n_channels, video_length, ngf=128, checkpoint_video=False, checkpoint_segments=2):
         super(VideoGenerator, self).__init__()
 
         self.n_channels = n_channels
         self.video_length = video_length
 
+        # ngf scales every generator width (ngf=128 gives the original 1024/512/256/128 channels)
+        self.ngf = ngf
+        # recompute the activations of the 3D stack in backward instead of keeping them
+        self.checkpoint_video = checkpoint_video
+        self.checkpoint_segments = checkpoint_segments
+
         self.background = nn.Sequential(
-            nn.ConvTranspose2d(1024, 1024, 4, 1, 0, bias=True),
-            nn.BatchNorm2d(1024),
+            nn.ConvTranspose2d(ngf * 8, ngf * 8, 4, 1, 0, bias=True),
+            nn.BatchNorm2d(ngf * 8),
             nn.ReLU(True),
-            nn.ConvTranspose2d(1024, 512, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(512),
+            nn.ConvTranspose2d(ngf * 8, ngf * 4, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf * 4),
             nn.ReLU(True),
-            nn.ConvTranspose2d(512, 256, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(256),
+            nn.ConvTranspose2d(ngf * 4, ngf * 2, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf * 2),
             nn.ReLU(True),
-            nn.ConvTranspose2d(256, 128, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(128),
+            nn.ConvTranspose2d(ngf * 2, ngf, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf),
             nn.ReLU(True),
-            nn.ConvTranspose2d(128, 3, 4, 2, 1, bias=True),
+            nn.ConvTranspose2d(ngf, 3, 4, 2, 1, bias=True),
             nn.Tanh()
             )
 
         self.video = nn.Sequential(
-            nn.ConvTranspose3d(1024, 1024, kernel_size=(2,4,4), stride=(1,2,2), padding=0),
-            nn.BatchNorm3d(1024),
+            nn.ConvTranspose3d(ngf * 8, ngf * 8, kernel_size=(2,4,4), stride=(1,2,2), padding=0),
+            nn.BatchNorm3d(ngf * 8),
             nn.ReLU(True),
 
-            nn.ConvTranspose3d(1024, 512, 4, stride=(1,2,2), padding=(0,1,1), bias=True),
-            nn.BatchNorm3d(512),
+            nn.ConvTranspose3d(ngf * 8, ngf * 4, 4, stride=(1,2,2), padding=(0,1,1), bias=True),
+            nn.BatchNorm3d(ngf * 4),
             nn.ReLU(True),
 
-            nn.ConvTranspose3d(512, 256, 4, stride=(1,2,2), padding=(0,1,1), bias=True),
-            nn.BatchNorm3d(256),
+            nn.ConvTranspose3d(ngf * 4, ngf * 2, 4, stride=(1,2,2), padding=(0,1,1), bias=True),
+            nn.BatchNorm3d(ngf * 2),
             nn.ReLU(True),
 
-            nn.ConvTranspose3d(256, 128, kernel_size=(2, 4, 4), stride=(1,2,2), padding=(0,1,1), bias=True),
-            nn.BatchNorm3d(128),
+            nn.ConvTranspose3d(ngf * 2, ngf, kernel_size=(2, 4, 4), stride=(1,2,2), padding=(0,1,1), bias=True),
+            nn.BatchNorm3d(ngf),
             nn.ReLU(True),
         )
 
-        self.gen_net = nn.Sequential(nn.ConvTranspose3d(128, 3, kernel_size=(2, 4, 4), stride=(1,2,2), padding=(0,1,1)),
+        self.gen_net = nn.Sequential(nn.ConvTranspose3d(ngf, 3, kernel_size=(2, 4, 4), stride=(1,2,2), padding=(0,1,1)),
                                      nn.Tanh())
-        self.mask_net = nn.Sequential(nn.ConvTranspose3d(128, 1, kernel_size=(2,4,4), stride=(1,2,2), padding=(0,1,1)),
+        self.mask_net = nn.Sequential(nn.ConvTranspose3d(ngf, 1, kernel_size=(2,4,4), stride=(1,2,2), padding=(0,1,1)),
                                       nn.Sigmoid())
 
         self.encoder = nn.Sequential(
-            nn.Conv2d(self.n_channels, 128, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(128),
+            nn.Conv2d(self.n_channels, ngf, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf),
             nn.ReLU(inplace=True),
-            nn.Conv2d(128, 256, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(256),
+            nn.Conv2d(ngf, ngf * 2, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf * 2),
             nn.ReLU(inplace=True),
-            nn.Conv2d(256, 512, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(512),
+            nn.Conv2d(ngf * 2, ngf * 4, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf * 4),
             nn.ReLU(inplace=True),
-            nn.Conv2d(512, 1024, 4, 2, 1, bias=True),
-            nn.BatchNorm2d(1024),
+            nn.Conv2d(ngf * 4, ngf * 8, 4, 2, 1, bias=True),
+            nn.BatchNorm2d(ngf * 8),
             nn.ReLU(inplace=True),
-            nn.Conv2d(1024, 1024, 4, 1, 0, bias=True),
-            nn.BatchNorm2d(1024),
+            nn.Conv2d(ngf * 8, ngf * 8, 4, 1, 0, bias=True),
+            nn.BatchNorm2d(ngf * 8),
             nn.ReLU(True),
         )
 
 
+    def checkpointed_video(self, x):
+        # self.video split into checkpoint_segments segments; all but the last are recomputed in backward,
+        # with their BatchNorm3d running statistics left as the forward pass set them
+        layers = list(self.video.children())
+        size = len(layers) // self.checkpoint_segments
+        end = 0
+        for start in range(0, size * (self.checkpoint_segments - 1), size):
+            end = start + size
+            segment = nn.Sequential(*layers[start:end])
+            x = checkpoint(segment, x, use_reentrant=False,
+                           context_fn=lambda segment=segment: (nullcontext(), frozen_bn_stats(segment)))
+        for layer in layers[end:]:
+            x = layer(x)
+        return x
+
     def forward(self, input):
-        # print("generator input:", input.shape)
-        x = self.encoder(input) # bs, 1024, 1, 1
-        x_v = x.unsqueeze(2) # bs, 1024, 1, 1, 1
-        # print(x_v.shape)
-        video = self.video(x_v)
+        x = self.encoder(input) # bs, ngf * 8, 1, 1
+        x_v = x.unsqueeze(2) # bs, ngf * 8, 1, 1, 1
+
+        if self.checkpoint_video and torch.is_grad_enabled():
+            video = self.checkpointed_video(x_v)
+        else:
+            video = self.video(x_v)
 
         foregound = self.gen_net(video)
         mask = self.mask_net(video)
-        # print("fg",foregound.shape, "mask",mask.shape)
+        # fg: bs, 3, len, 64, 64, mask: bs, 1, len, 64, 64
 
         background = self.background(x)
-        # print("bg", background.shape)
-        background_frames = background.unsqueeze(2).repeat(1,1,self.video_length,1,1)
-        # print("fg",foregound.shape,"mask",mask.shape,"bg",background.shape)
+        # bg: bs, 3, 64, 64 -> bs, 3, 1, 64, 64, broadcast over len
 
-        output = mask * foregound + (1-mask) * background_frames
-        # print("output",output.shape)
+        output = mask * foregound + (1-mask) * background.unsqueeze(2)
         return output
@@ -11,6 +11,7 @@ from torch.autograd import Variable
 import torch.optim as optim
 
 from models import vgan as vgan
+from checkpoint import CheckpointWriter
 
 def denorm(x):
     out = (x + 1) / 2
@@ -28,6 +29,9 @@ class Trainer(object):
         self.dim_z_category = int(config.dim_z_category)
         self.dim_z_motion = int(config.dim_z_motion)
         self.video_length = int(config.video_length)
+        self.ngf = int(getattr(config, 'ngf', 128))
+        self.checkpoint_video = getattr(config, 'checkpoint_video', False)
+        self.checkpoint_segments = int(getattr(config, 'checkpoint_segments', 2))
 
         self.lr = config.lr
         self.beta1 = config.beta1
@@ -51,14 +55,16 @@ class Trainer(object):
         self.train_batches = int(config.batches)
 
         self.use_cuda = config.cuda
+        self.device = torch.device('cuda' if self.use_cuda else 'cpu')
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(getattr(config, 'keep_last', 0), getattr(config, 'keep_every', 0))
+
         self.build_model()
 
-        if self.use_cuda:
-            self.generator.cuda()
-            self.discriminator.cuda()
+        self.generator.to(self.device)
+        self.discriminator.to(self.device)
 
 
     def load_model(self):
@@ -81,8 +87,8 @@ class Trainer(object):
         D_filename = '{}/netD_epoch-{}_step-{}.pth'.format(self.outf, self.start_epoch, self.start_step)
 
 
-        self.generator.load_state_dict(torch.load(G_filename))
-        self.discriminator.load_state_dict(torch.load(D_filename))
+        self.generator.load_state_dict(torch.load(G_filename, map_location=self.device))
+        self.discriminator.load_state_dict(torch.load(D_filename, map_location=self.device))
 
 
         print("[*] Model loaded: {}".format(G_filename))
@@ -90,7 +96,9 @@ class Trainer(object):
 
 
     def build_model(self):
-        self.generator = vgan.VideoGenerator(self.n_channels, self.video_length)
+        self.generator = vgan.VideoGenerator(self.n_channels, self.video_length, ngf=self.ngf,
+                                             checkpoint_video=self.checkpoint_video,
+                                             checkpoint_segments=self.checkpoint_segments)
         self.discriminator = vgan.VideoDiscriminator(n_channels=self.n_channels)
 
         if self.outf != None:
@@ -98,10 +106,8 @@ class Trainer(object):
 
     def train(self):
         self.gan_criterion = nn.BCEWithLogitsLoss()
-
-        if self.use_cuda:
-            self.generator.cuda()
-            self.discriminator.cuda()
+        self.real_target = torch.ones((), device=self.device)
+        self.fake_target = torch.zeros((), device=self.device)
 
         # create optimizers
         opt_generator = optim.Adam(self.generator.parameters(), lr=self.lr, betas=(self.beta1, self.beta2), weight_decay=self.weight_decay)
@@ -109,7 +115,7 @@ class Trainer(object):
                                              weight_decay=self.weight_decay)
 
         A_loader, B_loader = iter(self.image_loader), iter(self.video_loader)
-        valid_x_A, valid_x_B = A_loader.next(), B_loader.next()
+        valid_x_A, valid_x_B = next(A_loader), next(B_loader)
         valid_x_A, valid_x_B = valid_x_A["images"], valid_x_B["images"]
         valid_x_B = valid_x_B.permute(0,2,1,3,4)
 
@@ -125,12 +131,12 @@ class Trainer(object):
 
             for step in range(len(self.video_loader)):
                 try:
-                    realIm, realGif = A_loader.next(), B_loader.next()
+                    realIm, realGif = next(A_loader), next(B_loader)
                     realGif, realIm = realGif["images"], realIm["images"]
 
                 except StopIteration:
                     A_loader, B_loader = iter(self.image_loader), iter(self.video_loader)
-                    realIm, realGif = A_loader.next(), B_loader.next()
+                    realIm, realGif = next(A_loader), next(B_loader)
                     realGif, realIm = realGif["images"], realIm["images"]
 
                 if realIm.size(0) != realGif.size(0):
@@ -138,7 +144,7 @@ class Trainer(object):
                     continue
 
 
-                realIm, realGif = Variable(realIm.cuda(), requires_grad=False), Variable(realGif.cuda(), requires_grad=False)
+                realIm, realGif = Variable(realIm.to(self.device), requires_grad=False), Variable(realGif.to(self.device), requires_grad=False)
 
                 ############################
                 # (1) Update G network: minimize Lgan(MSE) + Lcycle(L1)
@@ -149,7 +155,7 @@ class Trainer(object):
                 fakeGif = self.generator(realIm)
 
                 output = self.discriminator(fakeGif)
-                loss_G = self.gan_criterion(output, Variable(torch.ones(output.size()).cuda()))
+                loss_G = self.gan_criterion(output, self.real_target.expand_as(output))
 
                 loss_G += torch.mean(torch.abs(fakeGif[:, :, 0, :, :] - realIm))
 
@@ -165,11 +171,11 @@ class Trainer(object):
                 self.discriminator.zero_grad()
 
                 D_real = self.discriminator(realGif)
-                loss_D_real = self.gan_criterion(D_real, Variable(torch.ones(D_real.size()).cuda()))
+                loss_D_real = self.gan_criterion(D_real, self.real_target.expand_as(D_real))
 
                 # train with fake
                 D_fake = self.discriminator(fakeGif.detach())
-                loss_D_fake = self.gan_criterion(D_fake, Variable(torch.zeros(D_fake.size()).cuda()))
+                loss_D_fake = self.gan_criterion(D_fake, self.fake_target.expand_as(D_fake))
 
                 loss_D = loss_D_real + loss_D_fake
 
@@ -193,11 +199,14 @@ class Trainer(object):
 
 
             if epoch % self.checkpoint_step == 0:
-                torch.save(self.generator.state_dict(), '%s/netG_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
-                torch.save(self.discriminator.state_dict(), '%s/netD_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
+                self.checkpoint.save({
+                    '%s/netG_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.generator.state_dict(),
+                    '%s/netD_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.discriminator.state_dict()})
 
                 print("Saved checkpoint")
 
+        self.checkpoint.close()
+
     def _get_variable(self, inputs):
-        out = Variable(inputs.cuda())
+        out = Variable(inputs.to(self.device))
         return out
@@ -6,6 +6,7 @@ from torch.autograd import Variable
 
 import models.dcgan as dcgan
 import models.mlp as mlp
+from checkpoint import CheckpointWriter
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -44,6 +45,8 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.build_model()
 
         if self.cuda:
@@ -173,5 +176,7 @@ class Trainer(object):
                             normalize=True)
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch))
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
+
+        self.checkpoint.close()
@@ -0,0 +1,49 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+import contextlib
+import io
+
+import torch
+from torch.utils.benchmark import Timer
+
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=100, help='input batch size')
+parser.add_argument('--f_div', default='KL', help='KL | RKL | Pearson | Neyman | Squared_Hellinger | JS | GAN')
+parser.add_argument('--iters', type=int, default=20, help='timed iterations per setting')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def get_trainer(config, reuse_fake):
+    args = ['--dataset', 'mnist', '--batch_size', str(config.batch_size), '--f_div', config.f_div]
+    if reuse_fake:
+        args.append('--reuse_fake')
+    if config.cuda:
+        args.append('--cuda')
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Trainer(trainer_parser.parse_args(args), None)
+
+
+def bench_reuse_fake(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+    real = torch.rand(config.batch_size, 1, 28, 28, device=device) * 2 - 1
+
+    print("[*] fGAN train step (%s): new G sample vs reused D step fake, batch %d" % (config.f_div, config.batch_size))
+    for name, reuse_fake in (('new', False), ('reuse', True)):
+        torch.manual_seed(0)
+        trainer = get_trainer(config, reuse_fake)
+
+        step_time = Timer('trainer.train_step(real)', globals=locals(),
+                          num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        print('%-5s - step: %.2f ms, %.2f steps/s' % (name, step_time * 1e3, 1 / step_time))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    bench_reuse_fake(config)
@@ -0,0 +1,102 @@
+"""
+Usage: sweep.py --dataset mnist [options] [--f_divs KL RKL ...] [--cores_per_run N]
+
+Trains one model per f-divergence in parallel processes. The dataset is decoded once into
+shared memory, each run is pinned to its own set of cores and writes to <outf>/<f_div>,
+and the per-run metrics are collected into <outf>/sweep_summary.json.
+"""
+
+from __future__ import print_function
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+import torch.multiprocessing as mp
+import torch.utils.data
+
+from config import parser
+from data_loader import get_loader
+from trainer import Trainer
+
+parser.add_argument('--f_divs', nargs='+', default=['KL', 'RKL', 'Pearson', 'Neyman', 'Squared_Hellinger', 'JS', 'GAN'],
+                    help='f-divergences to train, one run each')
+parser.add_argument('--sweep_workers', type=int, default=0, help='runs training at the same time, 0 for all of them')
+parser.add_argument('--cores_per_run', type=int, default=0, help='cores pinned to each run, 0 to split them evenly')
+parser.add_argument('--manual_seed', type=int, default=1, help='seed shared by every run')
+
+
+def load_dataset(config):
+    # decode and normalize the images once; the workers read them from shared memory
+    data_loader = get_loader(_dataset=config.dataset, dataroot=config.dataroot, batch_size=1000,
+                             num_workers=int(config.workers), image_size=config.image_size)
+    images = torch.cat([images for images, _ in data_loader], 0)
+    return images.share_memory_()
+
+
+def core_sets(n_runs, cores_per_run=0):
+    cores = sorted(os.sched_getaffinity(0))
+    cores_per_run = cores_per_run or max(1, len(cores) // n_runs)
+    return [[cores[(i * cores_per_run + j) % len(cores)] for j in range(cores_per_run)] for i in range(n_runs)]
+
+
+def run(index, f_div, cores, config, images):
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    torch.manual_seed(config.manual_seed)
+    if config.cuda:
+        torch.cuda.set_device(index % torch.cuda.device_count())
+        torch.cuda.manual_seed_all(config.manual_seed)
+
+    config.f_div = f_div
+    config.outf = os.path.join(config.outf, f_div)
+    if not os.path.exists(config.outf):
+        os.makedirs(config.outf)
+
+    # the decoded images need no loader workers; the labels are never used
+    dataset = torch.utils.data.TensorDataset(images, torch.zeros(len(images)))
+    data_loader = torch.utils.data.DataLoader(dataset, batch_size=config.batch_size, shuffle=True)
+
+    with open(os.path.join(config.outf, 'train.log'), 'w') as log, contextlib.redirect_stdout(log):
+        metrics = Trainer(config, data_loader).train()
+
+    metrics['cores'] = cores
+    with open(os.path.join(config.outf, 'metrics.json'), 'w') as f:
+        json.dump(metrics, f, indent=2)
+    return metrics
+
+
+def sweep(config, images):
+    cores = core_sets(len(config.f_divs), config.cores_per_run)
+    workers = config.sweep_workers or len(config.f_divs)
+
+    start_time = time.time()
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn')) as pool:
+        futures = [pool.submit(run, i, f_div, cores[i], config, images) for i, f_div in enumerate(config.f_divs)]
+        summary = [future.result() for future in futures]
+    elapsed = time.time() - start_time
+
+    with open(os.path.join(config.outf, 'sweep_summary.json'), 'w') as f:
+        json.dump({'time': elapsed, 'runs': summary}, f, indent=2)
+
+    print('%-17s %12s %12s %12s %10s %8s' % ('f_div', 'loss_d_real', 'loss_d_fake', 'loss_g', 'time', 'steps/s'))
+    for metrics in summary:
+        print('%-17s %12.4f %12.4f %12.4f %9.1fs %8.2f'
+              % (metrics['f_div'], metrics['loss_d_real'], metrics['loss_d_fake'], metrics['loss_g'],
+                 metrics['time'], metrics['steps_per_sec']))
+    print('sweep: %.1fs wall, %.1fs summed over runs' % (elapsed, sum(metrics['time'] for metrics in summary)))
+    return summary
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    if config.outf is None:
+        config.outf = 'samples'
+    if not os.path.exists(config.outf):
+        os.makedirs(config.outf)
+
+    images = load_dataset(config)
+    print("[*] %d images decoded into shared memory (%.1f MB)" % (len(images), images.numel() * 4 / 2 ** 20))
+    sweep(config, images)
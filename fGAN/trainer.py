@@ -1,3 +1,5 @@
+import time
+
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -5,6 +7,7 @@ import torchvision.utils as vutils
 from torch.autograd import Variable
 
 import models.fgan as fgan
+from checkpoint import CheckpointWriter
 
 
 def weights_init(m):
@@ -39,7 +42,10 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.f_div = config.f_div
+        self.reuse_fake = config.reuse_fake
 
         self.build_model()
 
@@ -57,71 +63,72 @@ class Trainer(object):
         if self.config.netD != '':
             self.netD.load_state_dict(torch.load(self.config.netD))
 
+        # setup optimizer
+        self.optimizerD = optim.Adam(self.netD.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
+        self.optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
+
+    def train_step(self, real):
+        ## In f-gan, we don't need labels tensor
+        batch_size = real.size(0)
+
+        ############################
+        # (1) Update D network: minimize f_star(D(G)) - D
+        ###########################
+        # train with real
+        self.netD.zero_grad()
+        errD_real = -self.netD(real).mean()  # -D
+
+        # train with fake
+        noise = torch.randn(batch_size, self.nz, device=real.device)
+        fake = self.netG(noise)
+        output = self.netD(fake.detach())
+        errD_fake = self.netD.f_star(output).mean()  # F_star(D(G))
+        errD = errD_real + errD_fake  # F_star(D(G)) - D
+
+        errD.backward()
+        self.optimizerD.step()
+
+        ############################
+        # (2) Update G network: minimize -f_star(D(G))
+        ###########################
+        self.netG.zero_grad()
+
+        if not self.reuse_fake:
+            noise = torch.randn(batch_size, self.nz, device=real.device)
+            fake = self.netG(noise)
+        output = self.netD(fake)
+        errG = -self.netD.f_star(output).mean()  # -f_star(D(G))
+
+        errG.backward(inputs=list(self.netG.parameters()))  # no gradients for D's weights
+        self.optimizerG.step()
+
+        return errD_real, errD_fake, errG
+
     def train(self):
-        input = torch.FloatTensor(self.batch_size, self.nc, self.image_size, self.image_size)
-        noise = torch.FloatTensor(self.batch_size, self.nz)
         fixed_noise = torch.FloatTensor(self.batch_size, self.nz).normal_(0, 1)
-        ## In f-gan, we don't need labels tensor
 
         if self.cuda:
-            input = input.cuda()
-            noise, fixed_noise = noise.cuda(), fixed_noise.cuda()
+            fixed_noise = fixed_noise.cuda()
 
         fixed_noise = Variable(fixed_noise)
 
-        # setup optimizer
-        optimizerD = optim.Adam(self.netD.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
-        optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
-
+        start_time = time.time()
         for epoch in range(self.niter):
+            losses = [0, 0, 0]
             for i, data in enumerate(self.data_loader, 0):
-                ############################
-                # (1) Update D network: minimize f_star(D(G)) - D
-                ###########################
-                for p in self.netD.parameters():  # reset requires_grad
-                    p.requires_grad = True  # they are set to False below in netG update
-
-                # train with real
-                self.netD.zero_grad()
                 real_cpu, _ = data
-                batch_size = real_cpu.size(0)
                 if self.cuda:
                     real_cpu = real_cpu.cuda()
-                input.resize_as_(real_cpu).copy_(real_cpu)
-                inputv = Variable(input)
-                errD_real = -self.netD(inputv).mean()  # -D
-
-                # train with fake
-                noise.resize_(batch_size, self.nz).normal_(0, 1)
-                noisev = Variable(noise)
-                fake = self.netG(noisev)
-                output = self.netD(fake.detach())
-                errD_fake = self.netD.f_star(output).mean()  # F_star(D(G))
-                errD = errD_real + errD_fake  # F_star(D(G)) - D
-
-                errD.backward()
-                optimizerD.step()
-
-                ############################
-                # (2) Update G network: minimize -f_star(D(G))
-                ###########################
-                for p in self.netD.parameters():
-                    p.requires_grad = False  # to avoid computation
-                self.netG.zero_grad()
-
-                noise.resize_(batch_size, self.nz).normal_(0, 1)
-                noisev = Variable(noise)
-                fake = self.netG(noisev)
-                output = self.netD(fake)
-                errG = -self.netD.f_star(output).mean()  # -f_star(D(G))
-
-                errG.backward()
-                optimizerG.step()
+                errD_real, errD_fake, errG = [err.item() for err in self.train_step(real_cpu)]
+
+                losses[0] += errD_real
+                losses[1] += errD_fake
+                losses[2] += errG
 
                 if i % 1 == 0:
                     print('[%d/%d][%d/%d] Loss_D_real: %.4f Loss_D_fake: %.4f Loss_G: %.4f'
                           % (epoch, self.niter, i, len(self.data_loader),
-                             errD_real.data, errD_fake.data, errG.data))
+                             errD_real, errD_fake, errG))
                 if epoch == 0 and i == 0:
                     vutils.save_image(real_cpu,
                                       '%s/real_samples.png' % self.outf,
@@ -134,5 +141,16 @@ class Trainer(object):
                                       normalize=True)
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch))
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
+
+        self.checkpoint.close()
+
+        # last epoch mean losses and throughput, for comparing runs
+        elapsed = time.time() - start_time
+        return {'f_div': self.f_div,
+                'loss_d_real': losses[0] / len(self.data_loader),
+                'loss_d_fake': losses[1] / len(self.data_loader),
+                'loss_g': losses[2] / len(self.data_loader),
+                'time': elapsed,
+                'steps_per_sec': self.niter * len(self.data_loader) / elapsed}
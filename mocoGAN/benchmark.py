@@ -0,0 +1,234 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import types
+
+import torch
+from torch.utils.benchmark import Timer
+from torch.utils.data import DataLoader
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_flatten
+from torch.utils.flop_counter import FlopCounterMode
+
+from models import mocogan_z as mocogan
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=16, help='number of videos sampled per iteration')
+parser.add_argument('--dim_z_content', type=int, default=50, help='dimensionality of the content input, ie hidden space')
+parser.add_argument('--dim_z_motion', type=int, default=10, help='dimensionality of the motion input')
+parser.add_argument('--dim_z_category', type=int, default=6, help='dimensionality of categorical input')
+parser.add_argument('--video_lengths', type=int, nargs='+', default=[16, 32, 64], help='video lengths to benchmark')
+parser.add_argument('--iters', type=int, default=50, help='timed iterations per setting')
+parser.add_argument('--video_length', type=int, default=16, help='video length for the noise benchmark')
+parser.add_argument('--noise_sigma', type=float, default=0.1, help='instance noise magnitude for the noise benchmark')
+parser.add_argument('--train_batch_size', type=int, default=2, help='batch size for the train benchmark')
+parser.add_argument('--train_steps', type=int, default=2, help='steps for the train benchmark')
+parser.add_argument('--bench', nargs='+', default=['motion', 'noise', 'factorized', 'train'],
+                    help='benchmarks to run: motion, noise, factorized, train')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+def sample_z_m_loop(generator, num_samples, video_len):
+    # reference: one GRUCell step per frame, gathered with torch.cat
+    h_t = [generator.get_gru_initial_state(num_samples)]
+    e_t = generator.get_iteration_noise(num_samples, video_len)
+
+    for frame_num in range(video_len):
+        h_t.append(generator.recurrent(e_t[:, frame_num], h_t[-1]))
+
+    z_m_t = [h_k.view(-1, 1, generator.dim_z_motion) for h_k in h_t]
+    return torch.cat(z_m_t[1:], dim=1).view(-1, generator.dim_z_motion)
+
+
+def noise_forward_legacy(self, x):
+    # reference: a fresh noise tensor and a scaled copy on every forward
+    if self.use_noise:
+        return x + self.sigma * torch.randn(x.size(), device=x.device)
+    return x
+
+
+class AllocationCounter(TorchDispatchMode):
+    # counts op outputs that do not share storage with an op input
+    def __init__(self):
+        super(AllocationCounter, self).__init__()
+        self.count = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+
+        inputs = tree_flatten((args, kwargs))[0]
+        storages = set(t.untyped_storage().data_ptr() for t in inputs if isinstance(t, torch.Tensor))
+        for t in tree_flatten(out)[0]:
+            if isinstance(t, torch.Tensor) and t.untyped_storage().data_ptr() not in storages:
+                self.count += 1
+
+        return out
+
+
+def peak_memory(fn, cuda):
+    # cuda: peak allocated bytes; cpu: bytes of the tensors autograd keeps alive for backward
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn()
+
+    return sum(storages.values())
+
+
+def bench_motion(config):
+    generator = mocogan.VideoGenerator(3, config.dim_z_content, config.dim_z_category, config.dim_z_motion,
+                                       config.video_lengths[0])
+    if config.cuda:
+        generator.cuda()
+
+    print("[*] sample_z_m: GRUCell loop vs fused GRU (forward + backward)")
+    for video_len in config.video_lengths:
+        def loop():
+            sample_z_m_loop(generator, config.batch_size, video_len).sum().backward()
+
+        def fused():
+            generator.sample_z_m(config.batch_size, video_len).sum().backward()
+
+        loop_time = Timer('loop()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        fused_time = Timer('fused()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+
+        print('video_len: %3d - loop: %.3f ms, fused: %.3f ms, speedup: %.2fx'
+              % (video_len, loop_time * 1e3, fused_time * 1e3, loop_time / fused_time))
+
+
+def bench_noise(config):
+    gif = torch.randn(config.batch_size, 3, config.video_length, 64, 64)
+    if config.cuda:
+        gif = gif.cuda()
+
+    def allocations(discriminator):
+        discriminator(gif)
+        with AllocationCounter() as counter:
+            discriminator(gif)
+        return counter.count
+
+    settings = []
+    for name in ('none', 'legacy', 'buffer'):
+        discriminator = mocogan.VideoDiscriminator(3, use_noise=name != 'none', noise_sigma=config.noise_sigma)
+        if config.cuda:
+            discriminator.cuda()
+        if name == 'legacy':
+            for m in discriminator.modules():
+                if isinstance(m, mocogan.Noise):
+                    m.forward = types.MethodType(noise_forward_legacy, m)
+        settings.append((name, discriminator))
+
+    print("[*] VideoDiscriminator forward: instance noise allocations")
+    base = allocations(settings[0][1])
+    for name, discriminator in settings:
+        with torch.no_grad():
+            step_time = Timer('discriminator(gif)', globals=locals(),
+                              num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        count = allocations(discriminator)
+        print('%-6s - time: %.2f ms, allocations: %d (%d from noise)' % (name, step_time * 1e3, count, count - base))
+
+
+def bench_factorized(config):
+    gif = torch.randn(config.batch_size, 3, config.video_length, 64, 64)
+    if config.cuda:
+        gif = gif.cuda()
+
+    print("[*] Video discriminators: Conv3d vs factorized (2+1)D (forward + backward)")
+    for type in ('PatchVideoDiscriminator', 'VideoDiscriminator', 'CategoricalVideoDiscriminator'):
+        for factorized in (False, True):
+            kwargs = {'n_channels': 3}
+            if 'Categorical' in type:
+                kwargs['dim_categorical'] = config.dim_z_category
+            discriminator = getattr(mocogan, 'Factorized' + type if factorized else type)(**kwargs)
+            if config.cuda:
+                discriminator.cuda()
+
+            def step():
+                discriminator(gif)[0].mean().backward()
+
+            with FlopCounterMode(display=False) as flop_counter:
+                step()
+
+            step_time = Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+            memory = peak_memory(step, config.cuda)
+            n_params = sum(p.numel() for p in discriminator.parameters())
+
+            print('%-40s - params: %.2fM, GFLOPs: %.2f, time: %.2f ms, peak memory: %.1f MB'
+                  % (discriminator.__class__.__name__, n_params / 1e6, flop_counter.get_total_flops() / 1e9,
+                     step_time * 1e3, memory / 2 ** 20))
+
+
+class SyntheticVideos(torch.utils.data.Dataset):
+    # random clips or frames in the format of data_loader's datasets
+    def __init__(self, shape, n_categories, length):
+        self.shape = shape
+        self.n_categories = n_categories
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return {'images': torch.rand(self.shape) * 2 - 1, 'categories': i % self.n_categories}
+
+
+def bench_train(config):
+    # Trainer.train() end to end on synthetic data: G and D steps, samples and checkpoints.
+    # The video length is the trainer's default, which the categorical video discriminator expects
+    args = ['--dataroot', '', '--image_batch', str(config.train_batch_size), '--video_batch', str(config.train_batch_size),
+            '--batches', '1', '--log_interval', '1', '--checkpoint_step', '1',
+            '--dim_z_content', str(config.dim_z_content), '--dim_z_motion', str(config.dim_z_motion),
+            '--dim_z_category', str(config.dim_z_category)]
+    if config.cuda:
+        args.append('--cuda')
+    trainer_config = trainer_parser.parse_args(args)
+    trainer_config.outf = tempfile.mkdtemp()
+    trainer_config.manual_seed = 0
+
+    length = config.train_batch_size * config.train_steps
+    image_loader = DataLoader(SyntheticVideos((3, 64, 64), config.dim_z_category, length),
+                              batch_size=config.train_batch_size, drop_last=True)
+    video_loader = DataLoader(SyntheticVideos((3, trainer_config.video_length, 64, 64), config.dim_z_category, length),
+                              batch_size=config.train_batch_size, drop_last=True)
+
+    print("[*] Trainer.train(): %d steps, batch %d, video length %d"
+          % (config.train_steps, config.train_batch_size, trainer_config.video_length))
+    trainer = Trainer(trainer_config, image_loader, video_loader)
+    start_time = time.time()
+    trainer.train()
+    step_time = (time.time() - start_time) / config.train_steps
+    print('step: %.2f s, wrote %s' % (step_time, ', '.join(sorted(os.listdir(trainer_config.outf)))))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+
+    if 'motion' in config.bench:
+        bench_motion(config)
+    if 'noise' in config.bench:
+        bench_noise(config)
+    if 'factorized' in config.bench:
+        bench_factorized(config)
+    if 'train' in config.bench:
+        bench_train(config)
@@ -19,7 +19,7 @@ parser.add_argument('--use_noise', help='when specified instance noise is used')
 parser.add_argument('--noise_sigma', type=float, default=0, help='when use_noise is specified, noise_sigma controls the magnitude of the noise')
 
 parser.add_argument('--image_discriminator', default='PatchImageDiscriminator', help='specifies image disciminator type (see mocogan.py for a list of available models')
-parser.add_argument('--video_discriminator', default='CategoricalVideoDiscriminator', help='specifies video discriminator type (see mocogan.py for a list of available models')
+parser.add_argument('--video_discriminator', default='CategoricalVideoDiscriminator', help='specifies video discriminator type (see mocogan.py for a list of available models, Factorized* variants use (2+1)D convolutions)')
 
 parser.add_argument('--video_length', type=int, default=10, help='length of the video')
 parser.add_argument('--log_interval', type=int, default=100, help='save valid gif and image')
@@ -40,6 +40,8 @@ parser.add_argument('--dim_z_category', type=int, default=6, help='dimensionalit
 
 parser.add_argument('--cuda', action='store_true', help='enables cuda')
 parser.add_argument('--outf', default=None, help='folder to output images and videos ans model checkpoints')
+parser.add_argument('--keep_last', type=int, default=0, help='number of most recent checkpoints to keep, 0 keeps all')
+parser.add_argument('--keep_every', type=int, default=0, help='also keep every k-th checkpoint, 0 for none')
 
 def get_config():
     return parser.parse_args()
@@ -9,26 +9,66 @@ import torch.nn.parallel
 import torch.utils.data
 from torch.autograd import Variable
 
-import numpy as np
+def gru_sequence(cell, input, h_0):
+    # input: bs, len, input_size -> h_t: bs, len, hidden_size
+    # runs the fused GRU kernel (the one nn.GRU dispatches to) with the parameters of an nn.GRUCell
+    weights = [cell.weight_ih, cell.weight_hh, cell.bias_ih, cell.bias_hh]
+    h_t, _ = torch.gru(input, h_0.unsqueeze(0), weights, True, 1, 0.0, cell.training, False, True)
+    return h_t
 
-if torch.cuda.is_available():
-    T = torch.cuda
-else:
-    T = torch
 
+class SeededModule(nn.Module):
+    # draws its random numbers from its own torch.Generator on the device asked for;
+    # without a seed get_rng returns None and the global RNG is used
+    def __init__(self):
+        super(SeededModule, self).__init__()
+        self.seed = None
+        self.rng = None
 
-class Noise(nn.Module):
+    def manual_seed(self, seed):
+        self.seed = seed
+        self.rng = None
+
+    def get_rng(self, device):
+        if self.seed is None:
+            return None
+
+        if self.rng is None or self.rng.device != device:
+            self.rng = torch.Generator(device=device)
+            self.rng.manual_seed(self.seed)
+
+        return self.rng
+
+
+class Noise(SeededModule):
     def __init__(self, use_noise, sigma=0.2):
         super(Noise, self).__init__()
         self.use_noise = use_noise
         self.sigma = sigma
 
+        # noise is drawn in place into a buffer that is reused while the input shape stays the same
+        self.register_buffer('noise', None, persistent=False)
+
     def forward(self, x):
-        if self.use_noise:
-            return x + self.sigma * Variable(T.FloatTensor(x.size()).normal_(), requires_grad=False)
+        # instance noise is a training regularizer: skipped in eval mode
+        if self.use_noise and self.training:
+            if self.noise is None or self.noise.shape != x.shape or self.noise.device != x.device \
+                    or self.noise.dtype != x.dtype:
+                self.noise = torch.empty_like(x, memory_format=torch.contiguous_format)
+
+            self.noise.normal_(generator=self.get_rng(x.device))
+            return torch.add(x, self.noise, alpha=self.sigma)
         return x
 
 
+def seed_noise(modules, seed):
+    # gives every Noise layer of the given modules its own reproducible stream. seed itself is left
+    # to the video generator (and the global RNG): the layers take seed + 1, seed + 2, ...
+    noise_layers = [m for module in modules for m in module.modules() if isinstance(m, Noise)]
+    for i, noise in enumerate(noise_layers):
+        noise.manual_seed(seed + 1 + i)
+
+
 class ImageDiscriminator(nn.Module):
     def __init__(self, n_channels, ndf=64, use_noise=False, noise_sigma=None):
         super(ImageDiscriminator, self).__init__()
@@ -93,31 +133,48 @@ class PatchImageDiscriminator(nn.Module):
         return h, None
 
 
+def video_conv(in_channels, out_channels, kernel_size, stride, padding, factorized=False):
+    # factorized: a (1, kh, kw) spatial conv followed by a (kt, 1, 1) temporal conv ((2+1)D)
+    if not factorized:
+        return nn.Conv3d(in_channels, out_channels, kernel_size, stride=stride, padding=padding, bias=False)
+
+    kernel_size, stride, padding = [(v,) * 3 if isinstance(v, int) else v for v in (kernel_size, stride, padding)]
+
+    return nn.Sequential(
+        nn.Conv3d(in_channels, out_channels, (1,) + kernel_size[1:], stride=(1,) + stride[1:],
+                  padding=(0,) + padding[1:], bias=False),
+        nn.Conv3d(out_channels, out_channels, (kernel_size[0], 1, 1), stride=(stride[0], 1, 1),
+                  padding=(padding[0], 0, 0), bias=False),
+    )
+
+
 class PatchVideoDiscriminator(nn.Module):
-    def __init__(self, n_channels, n_output_neurons=1, bn_use_gamma=True, use_noise=False, noise_sigma=None, ndf=64):
+    def __init__(self, n_channels, n_output_neurons=1, bn_use_gamma=True, use_noise=False, noise_sigma=None, ndf=64,
+                 factorized=False):
         super(PatchVideoDiscriminator, self).__init__()
 
         self.n_channels = n_channels
         self.n_output_neurons = n_output_neurons
         self.use_noise = use_noise
         self.bn_use_gamma = bn_use_gamma
+        self.factorized = factorized
 
         self.main = nn.Sequential(
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(n_channels, ndf, 4, stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(n_channels, ndf, 4, stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.LeakyReLU(0.2, inplace=True),
 
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(ndf, ndf * 2, 4, stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(ndf, ndf * 2, 4, stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.BatchNorm3d(ndf * 2),
             nn.LeakyReLU(0.2, inplace=True),
 
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(ndf * 2, ndf * 4, 4, stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(ndf * 2, ndf * 4, 4, stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.BatchNorm3d(ndf * 4),
             nn.LeakyReLU(0.2, inplace=True),
 
-            nn.Conv3d(ndf * 4, 1, 4, stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(ndf * 4, 1, 4, stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
         )
 
     def forward(self, input):
@@ -127,35 +184,37 @@ class PatchVideoDiscriminator(nn.Module):
 
 
 class VideoDiscriminator(nn.Module):
-    def __init__(self, n_channels, n_output_neurons=1, bn_use_gamma=True, use_noise=False, noise_sigma=None, ndf=64):
+    def __init__(self, n_channels, n_output_neurons=1, bn_use_gamma=True, use_noise=False, noise_sigma=None, ndf=64,
+                 factorized=False):
         super(VideoDiscriminator, self).__init__()
 
         self.n_channels = n_channels
         self.n_output_neurons = n_output_neurons
         self.use_noise = use_noise
         self.bn_use_gamma = bn_use_gamma
+        self.factorized = factorized
 
         self.main = nn.Sequential(
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(n_channels, ndf, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(n_channels, ndf, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.LeakyReLU(0.2, inplace=True),
 
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(ndf, ndf * 2, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(ndf, ndf * 2, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.BatchNorm3d(ndf * 2),
             nn.LeakyReLU(0.2, inplace=True),
 
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(ndf * 2, ndf * 4, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(ndf * 2, ndf * 4, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.BatchNorm3d(ndf * 4),
             nn.LeakyReLU(0.2, inplace=True),
 
             Noise(use_noise, sigma=noise_sigma),
-            nn.Conv3d(ndf * 4, ndf * 8, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), bias=False),
+            video_conv(ndf * 4, ndf * 8, (3, 4, 4), stride=(1, 2, 2), padding=(0, 1, 1), factorized=factorized),
             nn.BatchNorm3d(ndf * 8),
             nn.LeakyReLU(0.2, inplace=True),
 
-            nn.Conv3d(ndf * 8, n_output_neurons, (2, 4, 4), 1, 0, bias=False),
+            video_conv(ndf * 8, n_output_neurons, (2, 4, 4), 1, 0, factorized=factorized),
         )
 
     def forward(self, input):
@@ -165,11 +224,13 @@ class VideoDiscriminator(nn.Module):
 
 
 class CategoricalVideoDiscriminator(VideoDiscriminator):
-    def __init__(self, n_channels, dim_categorical, n_output_neurons=1, use_noise=False, noise_sigma=None):
+    def __init__(self, n_channels, dim_categorical, n_output_neurons=1, use_noise=False, noise_sigma=None,
+                 factorized=False):
         super(CategoricalVideoDiscriminator, self).__init__(n_channels=n_channels,
                                                             n_output_neurons=n_output_neurons + dim_categorical,
                                                             use_noise=use_noise,
-                                                            noise_sigma=noise_sigma)
+                                                            noise_sigma=noise_sigma,
+                                                            factorized=factorized)
 
         self.dim_categorical = dim_categorical
 
@@ -182,7 +243,23 @@ class CategoricalVideoDiscriminator(VideoDiscriminator):
         return labels, categ
 
 
-class VideoGenerator(nn.Module):
+class FactorizedPatchVideoDiscriminator(PatchVideoDiscriminator):
+    def __init__(self, n_channels, **kwargs):
+        super(FactorizedPatchVideoDiscriminator, self).__init__(n_channels, factorized=True, **kwargs)
+
+
+class FactorizedVideoDiscriminator(VideoDiscriminator):
+    def __init__(self, n_channels, **kwargs):
+        super(FactorizedVideoDiscriminator, self).__init__(n_channels, factorized=True, **kwargs)
+
+
+class FactorizedCategoricalVideoDiscriminator(CategoricalVideoDiscriminator):
+    def __init__(self, n_channels, dim_categorical, **kwargs):
+        super(FactorizedCategoricalVideoDiscriminator, self).__init__(n_channels, dim_categorical, factorized=True,
+                                                                      **kwargs)
+
+
+class VideoGenerator(SeededModule):
     def __init__(self, n_channels, dim_z_content, dim_z_category, dim_z_motion,
                  video_length, ngf=64):
         super(VideoGenerator, self).__init__()
@@ -215,51 +292,51 @@ class VideoGenerator(nn.Module):
         )
 
 
-    def sample_z_m(self, num_samples, video_len=None):
+    def sample_motion(self, num_samples, video_len=None):
         video_len = video_len if video_len is not None else self.video_length
 
-        h_t = [self.get_gru_initial_state(num_samples)]
+        h_0 = self.get_gru_initial_state(num_samples)
+        e_t = self.get_iteration_noise(num_samples, video_len)
 
-        for frame_num in range(video_len):
-            e_t = self.get_iteration_noise(num_samples)
-            h_t.append(self.recurrent(e_t, h_t[-1]))
+        # bs, len, dim z motion: a strided view of the GRU output, which torch.cat reads without a copy
+        return gru_sequence(self.recurrent, e_t, h_0)
 
-        z_m_t = [h_k.view(-1, 1, self.dim_z_motion) for h_k in h_t]
-        z_m = torch.cat(z_m_t[1:], dim=1).view(-1, self.dim_z_motion)
-
-        return z_m
+    def sample_z_m(self, num_samples, video_len=None):
+        # z_m: bs * len, dim z motion
+        return self.sample_motion(num_samples, video_len).reshape(-1, self.dim_z_motion)
 
     def sample_z_categ(self, num_samples, video_len):
         video_len = video_len if video_len is not None else self.video_length
+        device = self.get_device()
 
-        classes_to_generate = np.random.randint(self.dim_z_category, size=num_samples)
-        one_hot = np.zeros((num_samples, self.dim_z_category), dtype=np.float32)
-        one_hot[np.arange(num_samples), classes_to_generate] = 1
-        one_hot_video = np.repeat(one_hot, video_len, axis=0)
-
-        one_hot_video = torch.from_numpy(one_hot_video)
-
-        if torch.cuda.is_available():
-            one_hot_video = one_hot_video.cuda()
+        classes_to_generate = torch.randint(self.dim_z_category, (num_samples,), device=device,
+                                            generator=self.get_rng(device))
+        one_hot = torch.zeros(num_samples, 1, self.dim_z_category, device=device)
+        one_hot.scatter_(2, classes_to_generate.view(num_samples, 1, 1), 1)
+        one_hot_video = one_hot.expand(num_samples, video_len, self.dim_z_category)
+        # one_hot_video: bs, len, dim z category (broadcast over len)
 
         return Variable(one_hot_video), classes_to_generate
 
     def sample_z_content(self, num_samples, video_len=None):
         video_len = video_len if video_len is not None else self.video_length
+        device = self.get_device()
+
+        content = torch.randn(num_samples, 1, self.dim_z_content, device=device, generator=self.get_rng(device))
+        content = content.expand(num_samples, video_len, self.dim_z_content)
+        # content: bs, len, dim z content (broadcast over len)
 
-        content = np.random.normal(0, 1, (num_samples, self.dim_z_content)).astype(np.float32)
-        content = np.repeat(content, video_len, axis=0)
-        content = torch.from_numpy(content)
-        if torch.cuda.is_available():
-            content = content.cuda()
         return Variable(content)
 
     def sample_z_video(self, num_samples, video_len=None):
+        video_len = video_len if video_len is not None else self.video_length
+
         z_content = self.sample_z_content(num_samples, video_len)
         z_category, z_category_labels = self.sample_z_categ(num_samples, video_len)
-        z_motion = self.sample_z_m(num_samples, video_len)
+        z_motion = self.sample_motion(num_samples, video_len)
 
-        z = torch.cat([z_content, z_category, z_motion], dim=1)
+        z = torch.cat([z_content, z_category, z_motion], dim=2)
+        z = z.view(num_samples * video_len, z.size(2))
 
         return z, z_category_labels
 
@@ -271,26 +348,28 @@ class VideoGenerator(nn.Module):
         h = self.main(z.view(z.size(0), z.size(1), 1, 1))
         h = h.view(int(h.size(0) / video_len), video_len, self.n_channels, h.size(3), h.size(3))
 
-        z_category_labels = torch.from_numpy(z_category_labels).type("torch.LongTensor")
-
-        if torch.cuda.is_available():
-            z_category_labels = z_category_labels.cuda()
-
         h = h.permute(0, 2, 1, 3, 4)
         return h, Variable(z_category_labels, requires_grad=False)
 
     def sample_images(self, num_samples):
         z, z_category_labels = self.sample_z_video(num_samples * self.video_length * 2)
 
-        j = np.sort(np.random.choice(z.size(0), num_samples, replace=False)).astype(np.int64)
+        j = torch.randperm(z.size(0), device=z.device, generator=self.get_rng(z.device))[:num_samples]
+        j, _ = torch.sort(j)
         z = z[j, ::]
         z = z.view(z.size(0), z.size(1), 1, 1)
         h = self.main(z)
 
         return h, None
 
+    def get_device(self):
+        return self.recurrent.weight_ih.device
+
     def get_gru_initial_state(self, num_samples):
-        return Variable(T.FloatTensor(num_samples, self.dim_z_motion).normal_())
+        device = self.get_device()
+        return Variable(torch.randn(num_samples, self.dim_z_motion, device=device, generator=self.get_rng(device)))
 
-    def get_iteration_noise(self, num_samples):
-        return Variable(T.FloatTensor(num_samples, self.dim_z_motion).normal_())
+    def get_iteration_noise(self, num_samples, video_len):
+        device = self.get_device()
+        return Variable(torch.randn(num_samples, video_len, self.dim_z_motion, device=device,
+                                    generator=self.get_rng(device)))
@@ -11,6 +11,7 @@ from torch.autograd import Variable
 import torch.optim as optim
 
 from models import mocogan_z as mocogan
+from checkpoint import CheckpointWriter
 
 def denorm(x):
     out = (x + 1) / 2
@@ -51,15 +52,18 @@ class Trainer(object):
         self.train_batches = int(config.batches)
 
         self.use_cuda = config.cuda
+        self.device = torch.device('cuda' if self.use_cuda else 'cpu')
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+        self.manual_seed = config.manual_seed
+
         self.build_model()
 
-        if self.use_cuda:
-            self.generator.cuda()
-            self.image_discriminator.cuda()
-            self.video_discriminator.cuda()
+        self.generator.to(self.device)
+        self.image_discriminator.to(self.device)
+        self.video_discriminator.to(self.device)
 
     def load_model(self):
         print("[*] Load models from {}...".format(self.outf))
@@ -81,9 +85,9 @@ class Trainer(object):
         D_V_filename = '{}/netD_V_epoch-{}_step-{}.pth'.format(self.outf, self.start_epoch, self.start_step)
         D_I_filename = '{}/netD_I_epoch-{}_step-{}.pth'.format(self.outf, self.start_epoch, self.start_step)
 
-        self.generator.load_state_dict(torch.load(G_filename))
-        self.video_discriminator.load_state_dict(torch.load(D_V_filename))
-        self.image_discriminator.load_state_dict(torch.load(D_I_filename))
+        self.generator.load_state_dict(torch.load(G_filename, map_location=self.device))
+        self.video_discriminator.load_state_dict(torch.load(D_V_filename, map_location=self.device))
+        self.image_discriminator.load_state_dict(torch.load(D_I_filename, map_location=self.device))
 
         print("[*] Model loaded: {}".format(G_filename))
         print("[*] Model loaded: {}".format(D_V_filename))
@@ -92,6 +96,7 @@ class Trainer(object):
 
     def build_model(self):
         self.generator = mocogan.VideoGenerator(self.n_channels, self.dim_z_content, self.dim_z_category, self.dim_z_motion, self.video_length)
+        self.generator.manual_seed(self.manual_seed)
 
         self.image_discriminator = self.build_discriminator(self.image_discriminator, n_channels=self.n_channels,
                                                         use_noise=self.use_noise, noise_sigma=self.noise_sigma)
@@ -99,6 +104,7 @@ class Trainer(object):
         self.video_discriminator = self.build_discriminator(self.video_discriminator, dim_categorical=self.dim_z_category,
                                                         n_channels=self.n_channels, use_noise=self.use_noise,
                                                         noise_sigma=self.noise_sigma)
+        mocogan.seed_noise([self.image_discriminator, self.video_discriminator], self.manual_seed)
 
         if self.outf != None:
             self.load_model()
@@ -115,13 +121,10 @@ class Trainer(object):
 
     def train(self):
         self.gan_criterion = nn.BCEWithLogitsLoss()
+        self.real_target = torch.ones((), device=self.device)
+        self.fake_target = torch.zeros((), device=self.device)
         self.category_criterion = nn.CrossEntropyLoss()
 
-        if self.use_cuda:
-            self.generator.cuda()
-            self.image_discriminator.cuda()
-            self.video_discriminator.cuda()
-
         # create optimizers
         opt_generator = optim.Adam(self.generator.parameters(), lr=self.lr, betas=(self.beta1, self.beta2), weight_decay=self.weight_decay)
         opt_image_discriminator = optim.Adam(self.image_discriminator.parameters(), lr=self.lr, betas=(self.beta1, self.beta2),
@@ -131,7 +134,7 @@ class Trainer(object):
 
 
         A_loader, B_loader = iter(self.image_loader), iter(self.video_loader)
-        valid_x_A, valid_x_B = A_loader.next(), B_loader.next()
+        valid_x_A, valid_x_B = next(A_loader), next(B_loader)
         valid_x_A, valid_x_B = valid_x_A["images"], valid_x_B["images"]
         valid_x_B = valid_x_B.permute(0,2,1,3,4)
 
@@ -147,13 +150,13 @@ class Trainer(object):
 
             for step in range(len(self.video_loader)):
                 try:
-                    realIm, realGif = A_loader.next(), B_loader.next()
+                    realIm, realGif = next(A_loader), next(B_loader)
                     realGifCateg, realImCateg = realGif["categories"], realIm["categories"]
                     realGif, realIm = realGif["images"], realIm["images"]
 
                 except StopIteration:
                     A_loader, B_loader = iter(self.image_loader), iter(self.video_loader)
-                    realIm, realGif = A_loader.next(), B_loader.next()
+                    realIm, realGif = next(A_loader), next(B_loader)
                     realGifCateg, realImCateg = realGif["categories"], realIm["categories"]
                     realGif, realIm = realGif["images"], realIm["images"]
 
@@ -162,7 +165,7 @@ class Trainer(object):
                     continue
 
 
-                realIm, realGif = Variable(realIm.cuda(), requires_grad=False), Variable(realGif.cuda(), requires_grad=False)
+                realIm, realGif = Variable(realIm.to(self.device), requires_grad=False), Variable(realGif.to(self.device), requires_grad=False)
 
                 image_batch_size = realIm.size(0)
 
@@ -177,7 +180,7 @@ class Trainer(object):
                 fakeGif, generated_categ = fake[0][0], fake[0][1]
 
                 output, fake_categ = self.video_discriminator(fakeGif)
-                loss_G = self.gan_criterion(output, Variable(torch.ones(output.size()).cuda()))
+                loss_G = self.gan_criterion(output, self.real_target.expand_as(output))
 
                 if self.config.use_infogan:
                     loss_G += self.category_criterion(fake_categ.squeeze(), generated_categ)
@@ -186,7 +189,7 @@ class Trainer(object):
                 fakeIm = fake[1][0]
 
                 output, fake_categ = self.image_discriminator(fakeIm)
-                loss_G += self.gan_criterion(output, Variable(torch.ones(output.size()).cuda()))
+                loss_G += self.gan_criterion(output, self.real_target.expand_as(output))
 
                 loss_G.backward()
                 opt_generator.step()
@@ -200,16 +203,16 @@ class Trainer(object):
                 self.video_discriminator.zero_grad()
 
                 D_real, real_categ = self.video_discriminator(realGif)
-                loss_D_real = self.gan_criterion(D_real, Variable(torch.ones(D_real.size()).cuda()))
+                loss_D_real = self.gan_criterion(D_real, self.real_target.expand_as(D_real))
 
                 # train with fake
                 D_fake, fake_categ = self.video_discriminator(fakeGif.detach())
-                loss_D_fake = self.gan_criterion(D_fake, Variable(torch.zeros(D_fake.size()).cuda()))
+                loss_D_fake = self.gan_criterion(D_fake, self.fake_target.expand_as(D_fake))
 
                 loss_D_V = loss_D_real + loss_D_fake
 
                 if self.config.use_categories:
-                    categories_gt = Variable(torch.squeeze(realGifCateg.long()), requires_grad=False).cuda()
+                    categories_gt = Variable(torch.squeeze(realGifCateg.long()).to(self.device), requires_grad=False)
                     loss_D_V += self.category_criterion(real_categ.squeeze(), categories_gt)
 
                 loss_D_V.backward()
@@ -221,11 +224,11 @@ class Trainer(object):
                 self.image_discriminator.zero_grad()
 
                 D_real = self.image_discriminator(realIm)[0]
-                loss_D_real = self.gan_criterion(D_real, Variable(torch.ones(D_real.size()).cuda()))
+                loss_D_real = self.gan_criterion(D_real, self.real_target.expand_as(D_real))
 
                 # train with fake
                 D_fake = self.image_discriminator(fakeIm.detach())[0]
-                loss_D_fake = self.gan_criterion(D_fake, Variable(torch.zeros(D_fake.size()).cuda()))
+                loss_D_fake = self.gan_criterion(D_fake, self.fake_target.expand_as(D_fake))
 
                 loss_D_I = loss_D_real + loss_D_fake
 
@@ -254,12 +257,15 @@ class Trainer(object):
                                       nrow=1)
 
                 if step% self.checkpoint_step == 0 and step != 0:
-                   torch.save(self.generator.state_dict(), '%s/netG_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
-                   torch.save(self.video_discriminator.state_dict(), '%s/netD_V_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
-                   torch.save(self.image_discriminator.state_dict(), '%s/netD_I_epoch-%d_step-%s.pth' % (self.outf, epoch, step))
+                   self.checkpoint.save({
+                       '%s/netG_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.generator.state_dict(),
+                       '%s/netD_V_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.video_discriminator.state_dict(),
+                       '%s/netD_I_epoch-%d_step-%s.pth' % (self.outf, epoch, step): self.image_discriminator.state_dict()})
 
                    print("Saved checkpoint")
 
+        self.checkpoint.close()
+
     def _get_variable(self, inputs):
-        out = Variable(inputs.cuda())
+        out = Variable(inputs.to(self.device))
         return out
@@ -0,0 +1,106 @@
+"""
+Usage: benchmark.py [options] [--cuda]
+"""
+
+import argparse
+import contextlib
+import io
+
+import torch
+from torch.utils.benchmark import Timer
+
+from config import parser as trainer_parser
+from trainer import Trainer
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--batch_size', type=int, default=16, help='effective batch size')
+parser.add_argument('--image_size', type=int, default=256, help='the height / width of the input image to network')
+parser.add_argument('--ngf', type=int, default=64, help='generator filters in first conv layer')
+parser.add_argument('--ndf', type=int, default=64, help='discriminator filters in first conv layer')
+parser.add_argument('--micro_batches', type=int, nargs='+', default=[1, 2, 4, 8], help='micro-batch counts to benchmark')
+parser.add_argument('--iters', type=int, default=3, help='timed iterations per setting')
+parser.add_argument('--cuda', action='store_true', help='enables cuda')
+
+
+class SavedTensor(object):
+    # a tensor saved for backward, counted as live until autograd frees it
+    def __init__(self, counter, tensor):
+        self.counter = counter
+        self.tensor = tensor
+        storage = tensor.untyped_storage()
+        self.ptr = storage.data_ptr()
+        counter.add(self.ptr, storage.nbytes())
+
+    def __del__(self):
+        self.counter.remove(self.ptr)
+
+
+class SavedTensorCounter(object):
+    def __init__(self):
+        self.storages = {}
+        self.live = 0
+        self.peak = 0
+
+    def add(self, ptr, nbytes):
+        if ptr not in self.storages:
+            self.storages[ptr] = [0, nbytes]
+            self.live += nbytes
+            self.peak = max(self.peak, self.live)
+        self.storages[ptr][0] += 1
+
+    def remove(self, ptr):
+        self.storages[ptr][0] -= 1
+        if self.storages[ptr][0] == 0:
+            self.live -= self.storages.pop(ptr)[1]
+
+
+def peak_memory(fn, cuda):
+    # cuda: peak allocated bytes; cpu: peak bytes of the tensors autograd keeps alive for backward
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated() - base
+
+    counter = SavedTensorCounter()
+    with torch.autograd.graph.saved_tensors_hooks(lambda tensor: SavedTensor(counter, tensor),
+                                                  lambda saved: saved.tensor):
+        fn()
+
+    return counter.peak
+
+
+def get_trainer(config, micro_batches):
+    args = ['--batch_size', str(config.batch_size), '--image_size', str(config.image_size),
+            '--ngf', str(config.ngf), '--ndf', str(config.ndf), '--micro_batches', str(micro_batches)]
+    if config.cuda:
+        args.append('--cuda')
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Trainer(trainer_parser.parse_args(args))
+
+
+def bench_micro_batches(config):
+    device = torch.device('cuda' if config.cuda else 'cpu')
+    real_a = torch.randn(config.batch_size, 3, config.image_size, config.image_size, device=device)
+    real_b = torch.randn(config.batch_size, 3, config.image_size, config.image_size, device=device)
+
+    print("[*] pix2pix train step: batch %d split into micro-batches (%dpx)" % (config.batch_size, config.image_size))
+    for micro_batches in config.micro_batches:
+        trainer = get_trainer(config, micro_batches)
+
+        def step():
+            trainer.train_step(real_a, real_b)
+
+        step_time = Timer('step()', globals=locals(), num_threads=torch.get_num_threads()).timeit(config.iters).mean
+        memory = peak_memory(step, config.cuda)
+
+        print('micro_batches: %2d - step: %.2f ms, %.1f images/s, peak memory: %.1f MB'
+              % (micro_batches, step_time * 1e3, config.batch_size / step_time, memory / 2 ** 20))
+
+
+if __name__ == "__main__":
+    config = parser.parse_args()
+    bench_micro_batches(config)
@@ -98,7 +98,7 @@ class GANLoss(nn.Module):
 
     def __call__(self, input, target_is_real):
         target_tensor = self.get_target_tensor(input, target_is_real)
-        return self.loss(input, target_tensor.cuda())
+        return self.loss(input, target_tensor.to(input.device))
 
 
 # Defines the generator that consists of Resnet blocks between a few
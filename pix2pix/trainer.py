@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -6,6 +8,7 @@ from torch.autograd import Variable
 from data_loader import get_loader
 
 import models.pix2pix as pix2pix
+from checkpoint import CheckpointWriter
 
 def weights_init(m):
     classname = m.__class__.__name__
@@ -15,6 +18,19 @@ def weights_init(m):
         m.weight.data.normal_(1.0, 0.02)
         m.bias.data.fill_(0)
 
+@contextmanager
+def frozen_bn_stats(net):
+    # batch norm still normalizes with the batch statistics but leaves its running statistics alone
+    bns = [m for m in net.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    momentum = [m.momentum for m in bns]
+    for m in bns:
+        m.momentum = 0.0
+    try:
+        yield
+    finally:
+        for m, value in zip(bns, momentum):
+            m.momentum = value
+
 class Trainer(object):
     def __init__(self, config):
         self.config = config
@@ -40,13 +56,18 @@ class Trainer(object):
 
         self.outf = config.outf
 
+        self.checkpoint = CheckpointWriter(config.keep_last, config.keep_every)
+
         self.lamb = config.lamb
+        self.micro_batches = config.micro_batches
 
         self.build_model()
 
         if self.cuda:
             self.netD.cuda()
             self.netG.cuda()
+            self.criterionGAN.cuda()
+            self.criterionL1.cuda()
 
     def build_model(self):
         self.netG = pix2pix.define_G(self.input_nc, self.output_nc, self.ngf, 'batch', False, [])
@@ -59,34 +80,97 @@ class Trainer(object):
         pix2pix.print_network(self.netG)
         pix2pix.print_network(self.netD)
         print('---------------------------------------------')
-        
+
+        self.criterionGAN = pix2pix.GANLoss()
+        self.criterionL1 = nn.L1Loss()
+
+        # setup optimizer
+        self.optimizerD = optim.Adam(self.netD.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
+        self.optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
+
+    def train_step(self, real_a, real_b):
+        # gradients are accumulated over micro_batches chunks of the batch before each optimizer step.
+        # batch norm normalizes each chunk with its own statistics, like a smaller batch would
+        batch_size = real_a.size(0)
+        chunks = list(zip(real_a.chunk(self.micro_batches), real_b.chunk(self.micro_batches)))
+        fake_bs = []
+        loss_d_total, loss_g_total = 0, 0
+
+        ############################
+        # (1) Update D network: maximize log(D(x,y)) + log(1 - D(x,G(x)))
+        ###########################
+        self.optimizerD.zero_grad()
+        for a, b in chunks:
+            weight = a.size(0) / float(batch_size)
+
+            # a single chunk keeps the graph of G for its update below, micro-batches recompute it there
+            with torch.set_grad_enabled(len(chunks) == 1):
+                fake_b = self.netG(a)
+            fake_bs.append(fake_b)
+
+            # train with fake
+            fake_ab = torch.cat((a, fake_b), 1)
+            pred_fake = self.netD.forward(fake_ab.detach())
+            loss_d_fake = self.criterionGAN(pred_fake, False)
+
+            # train with real
+            real_ab = torch.cat((a, b), 1)
+            pred_real = self.netD.forward(real_ab)
+            loss_d_real = self.criterionGAN(pred_real, True)
+
+            # Combined loss
+            loss_d = (loss_d_fake + loss_d_real) * 0.5 * weight
+
+            loss_d.backward()
+            loss_d_total += loss_d.detach()
+
+        self.optimizerD.step()
+
+        ############################
+        # (2) Update G network: maximize log(D(x,G(x))) + L1(y,G(x))
+        ##########################
+        self.optimizerG.zero_grad()
+        for (a, b), fake_b in zip(chunks, fake_bs):
+            weight = a.size(0) / float(batch_size)
+
+            if not fake_b.requires_grad:
+                # same output as in the D update, whose forward already updated the running statistics
+                with frozen_bn_stats(self.netG):
+                    fake_b = self.netG(a)
+
+            # First, G(A) should fake the discriminator
+            fake_ab = torch.cat((a, fake_b), 1)
+            pred_fake = self.netD.forward(fake_ab)
+            loss_g_gan = self.criterionGAN(pred_fake, True)
+
+            # Second, G(A) = B
+            loss_g_l1 = self.criterionL1(fake_b, b) * self.lamb
+
+            loss_g = (loss_g_gan + loss_g_l1) * weight
+
+            loss_g.backward()
+            loss_g_total += loss_g.detach()
+
+        self.optimizerG.step()
+
+        return loss_d_total, loss_g_total
+
     def train(self):
         train_data_loader = get_loader(dataroot=self.dataroot + "/train", batch_size=self.batch_size,
                                  num_workers=int(self.workers), shuffle = True)
         test_data_loader = get_loader(dataroot=self.dataroot + "/test", batch_size=self.batch_size,
                                        num_workers=int(self.workers), shuffle = False)
 
-        criterionGAN = pix2pix.GANLoss()
-        criterionL1 = nn.L1Loss()
-        criterionMSE = nn.MSELoss()
-
         real_a = torch.FloatTensor(self.batch_size, self.input_nc, 256, 256)
         real_b = torch.FloatTensor(self.batch_size, self.output_nc, 256, 256)
 
         if self.cuda:
-            criterionGAN = criterionGAN.cuda()
-            criterionL1 = criterionL1.cuda()
-            criterionMSE = criterionMSE.cuda()
             real_a = real_a.cuda()
             real_b = real_b.cuda()
 
         real_a = Variable(real_a)
         real_b = Variable(real_b)
 
-        # setup optimizer
-        optimizerD = optim.Adam(self.netD.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
-        optimizerG = optim.Adam(self.netG.parameters(), lr=self.lr, betas=(self.beta1, 0.999))
-
         for epoch in range(self.niter):
 
             for iteration, batch in enumerate(train_data_loader, 1):
@@ -94,56 +178,14 @@ class Trainer(object):
                 real_a_cpu, real_b_cpu = batch[0], batch[1]
                 real_a.data.resize_(real_a_cpu.size()).copy_(real_a_cpu)
                 real_b.data.resize_(real_b_cpu.size()).copy_(real_b_cpu)
-                fake_b = self.netG(real_a)
-
-                ############################
-                # (1) Update D network: maximize log(D(x,y)) + log(1 - D(x,G(x)))
-                ###########################
-
-                optimizerD.zero_grad()
-
-                # train with fake
-                fake_ab = torch.cat((real_a, fake_b), 1)
-                pred_fake = self.netD.forward(fake_ab.detach())
-                loss_d_fake = criterionGAN(pred_fake, False)
-
-                # train with real
-                real_ab = torch.cat((real_a, real_b), 1)
-                pred_real = self.netD.forward(real_ab)
-                loss_d_real = criterionGAN(pred_real, True)
 
-                # Combined loss
-                loss_d = (loss_d_fake + loss_d_real) * 0.5
-
-                loss_d.backward()
-
-                optimizerD.step()
-
-                ############################
-                # (2) Update G network: maximize log(D(x,G(x))) + L1(y,G(x))
-                ##########################
-                optimizerG.zero_grad()
-                # First, G(A) should fake the discriminator
-                fake_ab = torch.cat((real_a, fake_b), 1)
-                pred_fake = self.netD.forward(fake_ab)
-                loss_g_gan = criterionGAN(pred_fake, True)
-
-                # Second, G(A) = B
-                loss_g_l1 = criterionL1(fake_b, real_b) * self.lamb
-
-                loss_g = loss_g_gan + loss_g_l1
-
-                loss_g.backward()
-
-                optimizerG.step()
+                loss_d, loss_g = self.train_step(real_a, real_b)
 
                 print("===> Epoch[{}]({}/{}): Loss_D: {:.4f} Loss_G: {:.4f}".format(
-                    epoch, iteration, len(train_data_loader), loss_d.data[0], loss_g.data[0]))
+                    epoch, iteration, len(train_data_loader), loss_d.item(), loss_g.item()))
 
             # do checkpointing
-            torch.save(self.netG.state_dict(), '%s/netG_epoch_%03d.pth' % (self.outf, epoch))
-            torch.save(self.netD.state_dict(), '%s/netD_epoch_%03d.pth' % (self.outf, epoch)) 
-
-
-
+            self.checkpoint.save({'%s/netG_epoch_%03d.pth' % (self.outf, epoch): self.netG.state_dict(),
+                                  '%s/netD_epoch_%03d.pth' % (self.outf, epoch): self.netD.state_dict()})
 
+        self.checkpoint.close()